@@ -8,6 +8,39 @@ uint8_t webhid_leds = 0;
 // Global instance (forward declared in musicviz.h if needed, or just exposed here)
 musicviz_state_t mv = {0};
 
+// Latency echo of the newest packet, answered when its frame is rendered
+static struct {
+  uint8_t  pending;
+  uint16_t seq;
+  uint32_t host_ms;
+  uint32_t rx_ms;
+} echo = {0};
+
+static void put_u32(uint8_t *p, uint32_t v) {
+  p[0] = v & 0xFF; p[1] = (v >> 8) & 0xFF; p[2] = (v >> 16) & 0xFF; p[3] = (v >> 24) & 0xFF;
+}
+
+static uint32_t get_u32(const uint8_t *p) {
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+void musicviz_send_echo(void) {
+  if (!echo.pending) return;
+  echo.pending = 0;
+  
+  // Reply: magic, version, 'E', 0, seq (u16), host ms, rx ms, apply ms (u32, little-endian)
+  uint8_t reply[32] = {0};
+  reply[0] = 0x4D;
+  reply[1] = 0x01;
+  reply[2] = 0x45;
+  reply[4] = echo.seq & 0xFF;
+  reply[5] = echo.seq >> 8;
+  put_u32(&reply[6], echo.host_ms);
+  put_u32(&reply[10], echo.rx_ms);
+  put_u32(&reply[14], timer_read32());
+  raw_hid_send(reply, sizeof(reply));
+}
+
 void raw_hid_receive(uint8_t *data, uint8_t length) {
   // Raw HID reports are fixed-size (32 bytes in our protocol).
   if (length < 32) return;
@@ -21,6 +54,7 @@ void raw_hid_receive(uint8_t *data, uint8_t length) {
   mv.enabled       = (flags & 0x01) ? 1 : 0;
   mv.strobe_enable = (flags & 0x02) ? 1 : 0;
   mv.safety_limit  = (flags & 0x04) ? 1 : 0;
+  mv.stereo        = (flags & 0x10) ? 1 : 0;
   
   // Parse numeric fields
   mv.master_gain           = data[3];
@@ -39,5 +73,28 @@ void raw_hid_receive(uint8_t *data, uint8_t length) {
   mv.perimeter_sparkle     = data[16];
   mv.beat_refractory_ms    = data[17];
   
+  // Per-half levels (bytes 18–23), only sent by stereo-capable hosts
+  if (mv.stereo) {
+    mv.bass_l   = data[18];
+    mv.mid_l    = data[19];
+    mv.treble_l = data[20];
+    mv.bass_r   = data[21];
+    mv.mid_r    = data[22];
+    mv.treble_r = data[23];
+  } else {
+    mv.bass_l   = mv.bass_r   = mv.bass;
+    mv.mid_l    = mv.mid_r    = mv.mid;
+    mv.treble_l = mv.treble_r = mv.treble;
+  }
+  
   mv.last_rx_ms = timer_read32();
+  
+  // Echo request (flag 0x20): bytes 24–25 seq, 26–29 host ms. A newer packet
+  // replaces an unanswered one; only the packet that gets rendered is echoed.
+  if (flags & 0x20) {
+    echo.seq     = (uint16_t)data[24] | ((uint16_t)data[25] << 8);
+    echo.host_ms = get_u32(&data[26]);
+    echo.rx_ms   = mv.last_rx_ms;
+    echo.pending = 1;
+  }
 }
@@ -0,0 +1,199 @@
+"""Pre-analyze a music library in parallel: per-track feature files + index."""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .audio_analyzer import AudioAnalyzer, FEATURE_KEYS
+from .track_cache import TrackProfile, TrackProfiler, TrackCache
+from .audio_sources import WavFileSource, to_stereo
+from .feature_history import FeatureHistory
+from .scene_detector import SceneDetector
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 2
+HOP = 1024
+NFFT = 2048
+CHUNK_FRAMES = HOP * 64   # decode granularity; bounds memory per worker
+
+try:
+    # Optional: FLAC/OGG/AIFF/... support. WAV works without it.
+    import soundfile
+except ImportError:
+    soundfile = None
+
+def supported_extensions():
+    exts = {".wav"}
+    if soundfile is not None:
+        exts |= {"." + f.lower() for f in soundfile.available_formats()}
+    return exts
+
+def open_audio(path, chunk_frames=CHUNK_FRAMES):
+    """Return (sr, n_frames, block iterator) without reading the whole file."""
+    if path.lower().endswith(".wav"):
+        src = WavFileSource(path)
+        return src.sr, src.n_frames, src.blocks(chunk_frames)
+    if soundfile is None:
+        raise RuntimeError("soundfile is not installed")
+    info = soundfile.info(path)
+    blocks = soundfile.blocks(path, blocksize=chunk_frames, dtype='float32', always_2d=True)
+    return info.samplerate, info.frames, (to_stereo(b) for b in blocks)
+
+def analyze_file(path, out_path):
+    """
+    Worker: decode `path` in chunks, run the analyzer and write `out_path` (.npz).
+
+    The file holds uint8-quantized features per hop (columns = FEATURE_KEYS)
+    plus the TrackProfile fields used by the live track cache.
+    """
+    sr, n_frames, blocks = open_audio(path)
+    duration = n_frames / float(sr)
+    analyzer = AudioAnalyzer(sr=sr, nfft=NFFT, hop=HOP, stereo=True)
+    profiler = TrackProfiler(duration)
+    history = FeatureHistory(seconds=30.0, rate=sr / HOP)
+    scene = SceneDetector(history)
+
+    n_hops = n_frames // HOP
+    feats = np.zeros((n_hops, len(FEATURE_KEYS)), dtype=np.uint8)
+    i = 0
+    for f in analyzer.process_stream(blocks):
+        if i >= n_hops:
+            break
+        for j, k in enumerate(FEATURE_KEYS):
+            feats[i, j] = int(getattr(f, k) * 255)
+        t = i * HOP / sr
+        history.append(t, f)
+        # Only detected boundaries describe the track; forced scene changes do not
+        scene.update(t, f.kick)
+        profiler.observe(t, f, scene.boundary)
+        i += 1
+
+    profile = profiler.finish()
+    tmp = out_path + ".tmp"
+    with open(tmp, 'wb') as fh:
+        np.savez_compressed(
+            fh, features=feats[:i], sr=np.int32(sr), hop=np.int32(HOP),
+            duration=np.float32(duration),
+            beats=profile.beats if profile else np.zeros(0, np.float32),
+            sections=profile.sections if profile else np.zeros(0, np.float32),
+            loudness=np.round(profile.loudness * 255).astype(np.uint8) if profile else np.zeros(0, np.uint8),
+        )
+    os.replace(tmp, out_path)
+    return {'duration': duration, 'hops': i}
+
+def load_index(out_dir):
+    try:
+        with open(os.path.join(out_dir, INDEX_NAME)) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'version': INDEX_VERSION, 'tracks': {}}
+
+def save_index(out_dir, index):
+    path = os.path.join(out_dir, INDEX_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def scan(root, exts):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in exts:
+                yield os.path.join(dirpath, name)
+
+def track_key(path):
+    """File stem, e.g. "Artist - Track.wav" → "Artist - Track" (TrackInfo's format)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-analyze a folder of audio files.")
+    parser.add_argument("folder", help="Music library root")
+    parser.add_argument("--out", help="Output directory (default: <folder>/.musicviz)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--track-cache", action="store_true",
+                        help="Also seed the live track cache (keyed by file name 'Artist - Track')")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.folder)
+    out_dir = args.out or os.path.join(root, ".musicviz")
+    os.makedirs(out_dir, exist_ok=True)
+
+    index = load_index(out_dir)
+    tracks = index['tracks']
+    cache = TrackCache() if args.track_cache else None
+
+    todo = []
+    seen = set()
+    for path in scan(root, supported_extensions()):
+        rel = os.path.relpath(path, root)
+        seen.add(rel)
+        st = os.stat(path)
+        entry = tracks.get(rel)
+        out_name = hashlib.sha1(rel.encode('utf-8')).hexdigest()[:16] + ".npz"
+        if (entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime
+                and os.path.exists(os.path.join(out_dir, entry['features']))):
+            continue
+        todo.append((rel, path, out_name, st.st_size, st.st_mtime))
+
+    # Forget files that disappeared from the library
+    for rel in [r for r in tracks if r not in seen]:
+        try:
+            os.remove(os.path.join(out_dir, tracks.pop(rel)['features']))
+        except OSError:
+            pass
+
+    print(f"[*] {len(seen)} files, {len(todo)} to analyze, {args.jobs} workers")
+    if not todo:
+        save_index(out_dir, index)
+        return
+
+    started = time.time()
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(analyze_file, path, os.path.join(out_dir, out_name)): (rel, out_name, size, mtime)
+            for rel, path, out_name, size, mtime in todo
+        }
+        for fut in as_completed(futures):
+            rel, out_name, size, mtime = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                if done + failed:
+                    print()  # end the \r progress line
+                failed += 1
+                print(f"[-] {rel}: {e}")
+                continue
+
+            done += 1
+            tracks[rel] = {
+                'size': size, 'mtime': mtime, 'features': out_name,
+                'track': track_key(rel), 'duration': round(result['duration'], 3),
+            }
+            if cache is not None:
+                _seed_cache(cache, track_key(rel), os.path.join(out_dir, out_name))
+            if done % 50 == 0:
+                save_index(out_dir, index)
+            sys.stdout.write(f"\r[*] {done + failed}/{len(todo)}")
+            sys.stdout.flush()
+
+    save_index(out_dir, index)
+    elapsed = time.time() - started
+    print(f"\n[+] Analyzed {done} files ({failed} failed) in {elapsed:.1f}s → {out_dir}")
+
+def _seed_cache(cache, name, feature_path):
+    with np.load(feature_path) as z:
+        if len(z['loudness']) == 0:
+            return
+        profile = TrackProfile(float(z['duration']), z['beats'], z['sections'],
+                               z['loudness'].astype(np.float32) / 255.0)
+    cache.put(name, profile)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,62 @@
-"""FFT-based audio analysis: 3 bands + loudness + beat detection."""
+"""FFT-based audio analysis: 3 bands (per channel in stereo mode) + loudness + beat detection."""
 import numpy as np
 import time
 
+# Fields of FeatureFrame (fixed order for binary layouts)
+FEATURE_KEYS = (
+    'loudness_rms', 'loudness_peak', 'bass', 'mid', 'treble',
+    'beat', 'kick', 'snare', 'hihat',
+    'bass_l', 'mid_l', 'treble_l', 'bass_r', 'mid_r', 'treble_r', 'pan'
+)
+
+# Visual bands (Hz), in the order of the *_l / *_r features
+# Expert Optimized Crossover:
+# Bass: 40-150Hz -> Kick & Bass guitar core
+# Mid: 150-2500Hz -> Vocal body, snare body, guitar mids
+# Treble: 2500-20000Hz -> Snare snap, hi-hats, vocal air, lead synths/guitars
+VISUAL_BANDS = ((40, 150), (150, 2500), (2500, 20000))
+
+# Rhythm bands (Hz), transient only
+# Expert Tuning:
+# Kick: 60-150Hz -> Cut sub-bass rumble, focus on attack.
+# Snare: 1.5-4kHz -> Cut vocal/body resonance, focus on "snap" noise.
+# HiHat: 8-16kHz -> Standard high frequency range.
+RHYTHM_BANDS = ((60, 150), (1500, 4000), (8000, 16000))
+
+class FeatureFrame:
+    """Audio features for one hop as plain float attributes (all 0–1)."""
+    __slots__ = FEATURE_KEYS
+
+    def __init__(self):
+        for k in FEATURE_KEYS:
+            setattr(self, k, 0.0)
+
+    def copy_from(self, other):
+        for k in FEATURE_KEYS:
+            setattr(self, k, getattr(other, k))
+        return self
+
+def _clip01(x):
+    return 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
+
+def _band_slices(freqs, bands):
+    """
+    reduceat() indices for [f0, f1) bands over sorted bin frequencies.
+    Returns (idx, n): even positions of a reduceat over idx are the bands,
+    n holds the bin count of each band (0 = band has no bins).
+    """
+    idx, n = [], []
+    for f0, f1 in bands:
+        i0, i1 = np.searchsorted(freqs, [f0, f1])
+        n.append(i1 - i0)
+        # reduceat needs in-range indices; an empty band reads one dummy bin
+        i0 = min(i0, len(freqs) - 1)
+        idx += [i0, min(max(i1, i0 + 1), len(freqs))]
+    if idx[-1] == len(freqs):
+        # Last band runs to the end of the spectrum
+        idx.pop()
+    return np.array(idx), np.array(n)
+
 class AudioAnalyzer:
     """
     Performs real-time audio FFT analysis.
@@ -11,20 +66,48 @@ class AudioAnalyzer:
     - loudness_peak: frame peak (0–1)
     - bass, mid, treble: band energies (0–1)
     - beat: beat strength (0–1); computed from bass with dynamic threshold + refractory
+    - bass_l … treble_r: per-channel band energies (0–1); copies of bass/mid/treble in mono mode
+    - pan: balance of the two channels (0 = left, 0.5 = center, 1 = right)
+
+    With stereo=True both channels go through one 2-row rfft; the mono spectrum
+    is derived from it by linearity, so the extra cost is one FFT row plus the
+    band reductions, which run on all rows at once.
     """
     
-    def __init__(self, sr=48000, nfft=2048, hop=1024):
+    def __init__(self, sr=48000, nfft=2048, hop=1024, stereo=False):
         self.sr = sr
         self.nfft = nfft
         self.hop = hop
+        self.stereo = stereo
         self.window = np.hanning(nfft).astype(np.float32)
+
+        # Band tables: bins are sorted, so every band is one contiguous slice
+        freqs = np.fft.rfftfreq(nfft, d=1.0/sr)
+        self.visual_idx, self.visual_n = _band_slices(freqs, VISUAL_BANDS)
+        self.rhythm_idx, self.rhythm_n = _band_slices(freqs, RHYTHM_BANDS)
+        # Per-channel envelope coefficients (same as env_bass/mid/treble)
+        self.lr_attack = np.array([0.85, 0.60, 0.35])
+        self.lr_release = np.array([0.25, 0.15, 0.06])
+        self.beat_history_len = int(2.0 * sr / hop)
         
+        # Output frame, overwritten by every update()
+        self.frame = FeatureFrame()
+        self.reset()
+    
+    def reset(self):
+        """Forget all signal history (envelopes, peaks, onsets, FFT buffer)."""
         # Envelope followers (attack/release)
         # Tuned for "Jab-like" feel: faster attack, sharper release
         self.env_bass = Envelope(attack=0.85, release=0.25)
         self.env_mid = Envelope(attack=0.60, release=0.15)
         self.env_treble = Envelope(attack=0.35, release=0.06)
         self.env_loudness = Envelope(attack=0.50, release=0.10)
+
+        # Per-channel state, rows = (left, right), columns = VISUAL_BANDS.
+        # Both channels share one peak per band so their balance survives normalization.
+        self.lr_env = np.zeros((2, 3))
+        self.lr_peak = np.full(3, 0.01)
+        self.pan = 0.5
         
         # Adaptive normalization
         self.peak_tracks = {
@@ -41,54 +124,59 @@ class AudioAnalyzer:
         
         # Beat detection (legacy support for BPM)
         self.beat_history = []
-        self.beat_history_len = int(2.0 * sr / hop)
         self.prev_bass = 0.0
         
         # Circular buffer for FFT
-        self.buf = np.zeros((nfft, 2), dtype=np.float32)
+        self.buf = np.zeros((self.nfft, 2), dtype=np.float32)
+        self.frame.copy_from(FeatureFrame())
+    
+    def prewarm(self, hops=2):
+        """
+        Run a few silent hops, then reset. The first real update() then no
+        longer pays one-time costs (FFT twiddle cache, reduceat/ufunc setup,
+        buffer allocation) on the latency-critical first frame.
+        """
+        silence = np.zeros((self.hop, 2), dtype=np.float32)
+        for _ in range(hops):
+            self.update(silence)
+        self.reset()
+        return self
     
     def update(self, frame):
         """
         Process a frame of audio (shape: (hop, 2) for stereo, or (hop,) for mono).
-        Returns dict with audio features.
+        Returns the analyzer's FeatureFrame; it is reused, so copy it to keep values.
         """
         # Ensure stereo
         if frame.ndim == 1:
             frame = np.column_stack([frame, frame])
         
         # Shift buffer and append new frame
-        self.buf = np.roll(self.buf, -self.hop, axis=0)
-        self.buf[-self.hop:] = frame
-        
-        # Convert to mono
-        mono = self.buf.mean(axis=1)
-        windowed = mono * self.window
+        buf = self.buf
+        buf[:-self.hop] = buf[self.hop:]
+        buf[-self.hop:] = frame
         
-        # FFT
-        spec = np.fft.rfft(windowed)
+        if self.stereo:
+            # One 2-row FFT; mono = (L + R) / 2 in the frequency domain too
+            windowed = buf.T * self.window
+            spec = np.empty((3, self.nfft // 2 + 1), dtype=np.complex128)
+            spec[:2] = np.fft.rfft(windowed, axis=1)
+            np.add(spec[0], spec[1], out=spec[2])
+            spec[2] *= 0.5
+            energy = np.einsum('ij,ij->i', windowed, windowed)
+            mono = windowed.mean(axis=0)
+        else:
+            mono = buf.mean(axis=1) * self.window
+            spec = np.fft.rfft(mono)[np.newaxis]
         mag = np.abs(spec)
-        freqs = np.fft.rfftfreq(self.nfft, d=1.0/self.sr)
         
         # Loudness (RMS)
-        rms = float(np.sqrt(np.mean(windowed * windowed)) + 1e-12)
-        
-        # === Visual Bands (Smoothed) ===
-        # Expert Optimized Crossover:
-        # Bass: 40-150Hz -> Kick & Bass guitar core
-        # Mid: 150-2500Hz -> Vocal body, snare body, guitar mids
-        # Treble: 2500-20000Hz -> Snare snap, hi-hats, vocal air, lead synths/guitars
-        bass_raw = self._band_energy(mag, freqs, 40, 150)
-        mid_raw = self._band_energy(mag, freqs, 150, 2500)
-        treble_raw = self._band_energy(mag, freqs, 2500, 20000)
-        
-        # === Rhythm Bands (Transient Only) ===
-        # Expert Tuning:
-        # Kick: 60-150Hz -> Cut sub-bass rumble, focus on attack.
-        # Snare: 1.5-4kHz -> Cut vocal/body resonance, focus on "snap" noise.
-        # HiHat: 8-16kHz -> Standard high frequency range.
-        kick_raw  = self._transient_energy(mag, freqs, 60, 150)
-        snare_raw = self._transient_energy(mag, freqs, 1500, 4000)
-        hihat_raw = self._transient_energy(mag, freqs, 8000, 16000)
+        rms = float(np.sqrt(np.mean(mono * mono)) + 1e-12)
+        
+        # Visual bands (smoothed, every row) and rhythm bands (transient only, mono row)
+        visual = self._band_energy(mag)
+        bass_raw, mid_raw, treble_raw = visual[-1].tolist()
+        kick_raw, snare_raw, hihat_raw = self._transient_energy(mag[-1]).tolist()
 
         # Adaptive normalization
         pt = self.peak_tracks
@@ -102,7 +190,7 @@ class AudioAnalyzer:
             pt[k] = max(pt[k] * 0.990, v)
         
         def norm(v, p):
-            return np.clip(np.power(v / (p + 1e-6), 0.75), 0.0, 1.0)
+            return _clip01((v / (p + 1e-6)) ** 0.75)
 
         # Normalize Visual Bands
         bass_n = norm(bass_raw, pt['bass'])
@@ -132,50 +220,73 @@ class AudioAnalyzer:
         beat = is_kick
         
         # Clamp to 0–1
-        features = {
-            'loudness_rms': np.clip(loudness_e, 0.0, 1.0),
-            'loudness_peak': np.clip(np.clip(rms_n, 0.0, 1.0), 0.0, 1.0),
-            'bass': np.clip(bass_e, 0.0, 1.0),
-            'mid': np.clip(mid_e, 0.0, 1.0),
-            'treble': np.clip(treble_e, 0.0, 1.0),
-            'beat': beat,
-            'kick': beat,
-            'snare': is_snare,
-            'hihat': is_hihat
-        }
+        f = self.frame
+        f.loudness_rms = _clip01(loudness_e)
+        f.loudness_peak = rms_n
+        f.bass = _clip01(bass_e)
+        f.mid = _clip01(mid_e)
+        f.treble = _clip01(treble_e)
+        f.beat = beat
+        f.kick = beat
+        f.snare = is_snare
+        f.hihat = is_hihat
+        
+        # Per-channel levels
+        if self.stereo:
+            lr = visual[:2]
+            self.lr_peak = np.maximum(self.lr_peak * 0.995, lr.max(axis=0))
+            lr_n = np.clip((lr / (self.lr_peak + 1e-6)) ** 0.75, 0.0, 1.0)
+            env = self.lr_env
+            env += np.where(lr_n > env, self.lr_attack, self.lr_release) * (lr_n - env)
+            f.bass_l, f.mid_l, f.treble_l, f.bass_r, f.mid_r, f.treble_r = np.clip(env, 0.0, 1.0).ravel().tolist()
+
+            e_l, e_r = energy.tolist()
+            balance = 0.5 + 0.5 * (e_r - e_l) / (e_l + e_r + 1e-9)
+            self.pan += 0.2 * (balance - self.pan)
+            f.pan = _clip01(self.pan)
+        else:
+            f.bass_l = f.bass_r = f.bass
+            f.mid_l = f.mid_r = f.mid
+            f.treble_l = f.treble_r = f.treble
+            f.pan = 0.5
         
         # Legacy support
         self.prev_bass = bass_e
-        return features
+        return f
     
-    def _band_energy(self, mag, freqs, f0, f1):
+    def process_stream(self, chunks):
         """
-        Compute band energy using Peak/Mean mix for VISUALIZATION.
-        Smoothed response for LED radii.
+        Offline path: feed audio chunks of any length (shape (n, 2) or (n,))
+        and yield the FeatureFrame for every complete hop, in order.
         """
-        idx = (freqs >= f0) & (freqs < f1)
-        if not np.any(idx):
-            return 0.0
-        
-        band_mag = mag[idx]
+        pending = None
+        for chunk in chunks:
+            if pending is not None and len(pending):
+                chunk = np.concatenate([pending, chunk])
+            n_hops = len(chunk) // self.hop
+            for i in range(n_hops):
+                yield self.update(chunk[i * self.hop:(i + 1) * self.hop])
+            pending = chunk[n_hops * self.hop:]
+
+    def _band_energy(self, mag):
+        """
+        Compute VISUAL_BANDS energies using Peak/Mean mix for VISUALIZATION.
+        Smoothed response for LED radii. mag: (rows, bins) → (rows, 3).
+        """
+        total = np.add.reduceat(mag, self.visual_idx, axis=-1)[..., ::2]
+        peak = np.maximum.reduceat(mag, self.visual_idx, axis=-1)[..., ::2]
         
         # Balanced mix for smooth visuals
-        val = 0.6 * np.mean(band_mag) + 0.4 * np.max(band_mag)
-        return float(val)
+        return np.where(self.visual_n > 0, 0.6 * total / np.maximum(self.visual_n, 1) + 0.4 * peak, 0.0)
 
-    def _transient_energy(self, mag, freqs, f0, f1):
+    def _transient_energy(self, mag):
         """
-        Compute band energy using ONLY Peak for RHYTHM DETECTION.
+        Compute RHYTHM_BANDS energies using ONLY Peak for RHYTHM DETECTION.
         Ignores sustain/rumble, captures attack transients.
         """
-        idx = (freqs >= f0) & (freqs < f1)
-        if not np.any(idx):
-            return 0.0
-        
-        band_mag = mag[idx]
-        
         # 100% Peak to catch transients
-        return float(np.max(band_mag))
+        peak = np.maximum.reduceat(mag, self.rhythm_idx, axis=-1)[..., ::2]
+        return np.where(self.rhythm_n > 0, peak, 0.0)
     
     def _detect_onset(self, name, val_now, threshold=0.10, refractory=4):
         """
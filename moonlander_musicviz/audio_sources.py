@@ -0,0 +1,325 @@
+"""Audio sources (sound device, WAV, raw PCM, stdin) and the clocks that time them."""
+import os
+import sys
+import time
+import struct
+import numpy as np
+
+# === Clocks ===
+
+class WallClock:
+    """Real time. Used with live capture, where the device paces the loop."""
+
+    def now(self):
+        return time.time()
+
+    def advance(self, seconds):
+        pass
+
+
+class VirtualClock:
+    """
+    Time derived from the amount of audio consumed, so file-driven runs are
+    reproducible. speed=1.0 paces the loop to real time, speed=N to N× real
+    time, and speed=0 runs as fast as the pipeline allows.
+    """
+
+    def __init__(self, start=0.0, speed=0.0):
+        self.t = start
+        self.speed = speed
+        self._wall_start = time.perf_counter()
+        self._elapsed = 0.0
+
+    def now(self):
+        return self.t
+
+    def advance(self, seconds):
+        self.t += seconds
+        self._elapsed += seconds
+        if self.speed > 0:
+            ahead = self._elapsed / self.speed - (time.perf_counter() - self._wall_start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+# === Sources ===
+# Every source has .sr, .name and .realtime, is a context manager, and
+# read(n) returns float32 audio of shape (n, 2), or None at end of input.
+
+def pcm_to_float(raw, width):
+    """Little-endian integer PCM bytes → float32 samples in [-1, 1)."""
+    if width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if width == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    if width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        return (b[:, 0].astype(np.int32) | (b[:, 1].astype(np.int32) << 8) |
+                (b[:, 2].astype(np.int8).astype(np.int32) << 16)).astype(np.float32) / 8388608.0
+    return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+
+def to_stereo(x):
+    """(n, channels) → (n, 2): mono is duplicated, extra channels are dropped."""
+    if x.shape[1] == 1:
+        return np.repeat(x, 2, axis=1)
+    return x[:, :2]
+
+def query_devices():
+    """
+    One PortAudio device query. Pass the result to find_input_device() and
+    SoundDeviceSource() so startup enumerates devices only once.
+    """
+    import sounddevice as sd
+    return sd.query_devices()
+
+def find_input_device(pattern=None, devices=None):
+    """
+    Index of the first input device whose name contains `pattern`
+    (case-insensitive), or of the default input device if pattern is None.
+    Raises RuntimeError if nothing matches.
+    """
+    import sounddevice as sd
+    if devices is None:
+        devices = sd.query_devices()
+    if pattern is None:
+        i = sd.default.device[0]
+        if i is not None and i >= 0:
+            return i
+        pattern = ""
+    for i, d in enumerate(devices):
+        if pattern.lower() in d["name"].lower() and d["max_input_channels"] > 0:
+            return i
+    raise RuntimeError(f"No input device matching '{pattern}'.")
+
+
+class SoundDeviceSource:
+    """
+    Live capture through PortAudio. Works with any input device: BlackHole on
+    macOS, or a PulseAudio/PipeWire monitor on Linux (e.g. device "pulse" with
+    PULSE_SOURCE set to the monitor, or the monitor's name if it is listed).
+    """
+    realtime = True
+
+    def __init__(self, device=None, sr=48000, hop=1024, devices=None):
+        import sounddevice as sd
+        self._sd = sd
+        self.device = device
+        self.sr = sr
+        self.hop = hop
+        if devices is not None and device is not None:
+            # Reuse the caller's query_devices() result
+            self.info = devices[device]
+        else:
+            self.info = sd.query_devices(device, 'input')
+        self.name = self.info['name']
+        self.stream = None
+
+    def __enter__(self):
+        channels = min(2, self.info['max_input_channels'])
+        self.stream = self._sd.InputStream(device=self.device, channels=channels, samplerate=self.sr,
+                                           blocksize=self.hop, dtype='float32')
+        self.stream.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.stream.__exit__(*exc)
+        self.stream = None
+
+    def read(self, n):
+        audio, _ = self.stream.read(n)
+        return to_stereo(audio)
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def read_wav_header(f):
+    """
+    Parse the RIFF/WAVE chunks of an open file up to the start of the audio.
+    Returns (format, channels, sr, width, data_size) with the file positioned
+    at the first sample. format is WAVE_FORMAT_PCM or WAVE_FORMAT_IEEE_FLOAT
+    (EXTENSIBLE files are resolved to their sub-format).
+    Raises RuntimeError for anything else.
+    """
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise RuntimeError("not a RIFF/WAVE file")
+    fmt = None
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            raise RuntimeError("no audio data chunk")
+        chunk_id, size = head[:4], struct.unpack("<I", head[4:])[0]
+        if chunk_id == b"fmt ":
+            body = f.read(size + (size & 1))
+            tag, channels, sr, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # First two bytes of the sub-format GUID are the actual format tag
+                tag = struct.unpack("<H", body[24:26])[0]
+            fmt = (tag, channels, sr, bits // 8)
+        elif chunk_id == b"data":
+            break
+        else:
+            f.seek(size + (size & 1), 1)
+    if fmt is None:
+        raise RuntimeError("missing fmt chunk")
+    tag, channels, sr, width = fmt
+    if not ((tag == WAVE_FORMAT_PCM and width in (1, 2, 3, 4)) or
+            (tag == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8))):
+        raise RuntimeError(f"unsupported WAV encoding (format {tag:#x}, {width * 8} bit)")
+    if channels < 1:
+        raise RuntimeError("WAV file has no channels")
+    return tag, channels, sr, width, size
+
+
+class WavFileSource:
+    """
+    Streams a WAV file (integer PCM or IEEE float, including
+    WAVE_FORMAT_EXTENSIBLE headers); loop=True restarts at the end.
+    """
+    realtime = False
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self.name = path
+        self.f = open(path, 'rb')
+        try:
+            self.format, self.channels, self.sr, self.width, size = read_wav_header(self.f)
+        except (RuntimeError, struct.error) as e:
+            self.f.close()
+            raise RuntimeError(f"{path}: {e}") from None
+        self.frame_size = self.channels * self.width
+        self.data_start = self.f.tell()
+        # Streams written without a final size report 0 or 0xFFFFFFFF: read to EOF
+        file_size = os.fstat(self.f.fileno()).st_size
+        if size in (0, 0xFFFFFFFF) or self.data_start + size > file_size:
+            size = file_size - self.data_start
+        self.n_frames = size // self.frame_size
+        self.remaining = self.n_frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def rewind(self):
+        self.f.seek(self.data_start)
+        self.remaining = self.n_frames
+
+    def readframes(self, n):
+        """Raw bytes of up to n frames."""
+        n = min(n, self.remaining)
+        raw = self.f.read(n * self.frame_size)
+        raw = raw[:len(raw) - len(raw) % self.frame_size]
+        self.remaining -= len(raw) // self.frame_size
+        return raw
+
+    def decode(self, raw):
+        """Raw frames → float32 array of shape (n, 2)."""
+        if self.format == WAVE_FORMAT_IEEE_FLOAT:
+            x = np.frombuffer(raw, dtype='<f4' if self.width == 4 else '<f8').astype(np.float32)
+        else:
+            x = pcm_to_float(raw, self.width)
+        return to_stereo(x.reshape(-1, self.channels))
+
+    def blocks(self, n):
+        """Yield consecutive blocks of up to n frames (the last one may be short)."""
+        try:
+            while True:
+                raw = self.readframes(n)
+                if not raw:
+                    return
+                yield self.decode(raw)
+        finally:
+            self.close()
+
+    def read(self, n):
+        raw = self.readframes(n)
+        if len(raw) < n * self.frame_size and self.loop:
+            self.rewind()
+            raw += self.readframes(n - len(raw) // self.frame_size)
+        if not raw:
+            return None
+        x = self.decode(raw)
+        if len(x) < n:
+            x = np.vstack([x, np.zeros((n - len(x), 2), dtype=np.float32)])
+        return x
+
+
+class RawPcmSource:
+    """
+    Interleaved raw PCM from a file or stdin ("-").
+    fmt: 'f32' (float32) or 's16' (int16), little-endian.
+    """
+    realtime = False
+    FORMATS = {'f32': ('<f4', 4), 's16': ('<i2', 2)}
+
+    def __init__(self, path="-", sr=48000, channels=2, fmt='f32'):
+        self.path = path
+        self.sr = sr
+        self.channels = channels
+        self.fmt = fmt
+        self.dtype, self.width = self.FORMATS[fmt]
+        self.name = "stdin" if path == "-" else path
+        self.f = sys.stdin.buffer if path == "-" else open(path, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.f is not sys.stdin.buffer:
+            self.f.close()
+
+    def read(self, n):
+        size = n * self.channels * self.width
+        raw = self.f.read(size)
+        # Pipes may deliver less than asked; keep reading until EOF
+        while raw and len(raw) < size:
+            more = self.f.read(size - len(raw))
+            if not more:
+                break
+            raw += more
+        if not raw:
+            return None
+        raw = raw[:len(raw) - len(raw) % (self.channels * self.width)]
+        x = np.frombuffer(raw, dtype=self.dtype).astype(np.float32)
+        if self.fmt == 's16':
+            x /= 32768.0
+        x = to_stereo(x.reshape(-1, self.channels))
+        if len(x) < n:
+            x = np.vstack([x, np.zeros((n - len(x), 2), dtype=np.float32)])
+        return x
+
+
+def open_source(spec, sr=48000, hop=1024, loop=False):
+    """
+    Build a source from a command-line spec:
+      "device:<name or index>"  sound device (substring match)
+      "<file>.wav"              WAV file
+      "-" / "raw:<path>"        raw f32 stereo PCM at `sr` from stdin / a file
+    """
+    if spec.startswith("device:"):
+        dev = spec[len("device:"):]
+        devices = query_devices()
+        if dev.isdigit():
+            device = int(dev)
+            if device >= len(devices):
+                raise RuntimeError(f"No device with index {device} ({len(devices)} devices).")
+            if devices[device]['max_input_channels'] <= 0:
+                raise RuntimeError(f"Device {device} ('{devices[device]['name']}') has no inputs.")
+        else:
+            device = find_input_device(dev, devices)
+        return SoundDeviceSource(device, sr=sr, hop=hop, devices=devices)
+    if spec == "-":
+        return RawPcmSource("-", sr=sr)
+    if spec.startswith("raw:"):
+        return RawPcmSource(spec[len("raw:"):], sr=sr)
+    return WavFileSource(spec, loop=loop)
@@ -1,6 +1,5 @@
 import time
 import colorsys
-import collections
 import random
 import math
 from rich.layout import Layout
@@ -27,9 +26,6 @@ class TerminalDashboard:
         self.console = Console()
         self.layout = Layout()
         
-        # History for Sparkline (last 50 frames)
-        self.loudness_history = collections.deque([0.0] * 50, maxlen=50)
-        
         # Text animation state
         self.text_phase = 0.0
         self.marquee_offset = 0
@@ -53,7 +49,7 @@ class TerminalDashboard:
         c_b, c_m, c_t = colors
         
         # 1. Interpolate Bands
-        b, m, t = features.get('bass', 0), features.get('mid', 0), features.get('treble', 0)
+        b, m, t = features.bass, features.mid, features.treble
         bars = []
         for i in range(num_bars):
             pos = i / max(1, num_bars - 1)
@@ -93,10 +89,10 @@ class TerminalDashboard:
                 
                 # Particles (more subtle)
                 if char == "  ":
-                    if features.get('snare', 0) > 0.5 and random.random() > 0.95:
+                    if features.snare > 0.5 and random.random() > 0.95:
                         char = ".."
                         col = "white"
-                    elif features.get('hihat', 0) > 0.5 and random.random() > 0.98:
+                    elif features.hihat > 0.5 and random.random() > 0.98:
                         char = "::"
                         col = c_t
 
@@ -106,13 +102,32 @@ class TerminalDashboard:
             
         return Align.center(Group(*rows), vertical="middle")
 
+    def _get_sparkline(self, values, color, width=30):
+        """Render the last `width` values (0–1) as a one-line sparkline."""
+        chars = " ▁▂▃▄▅▆▇█"
+        values = values[-width:]
+        line = "".join(chars[min(8, max(0, int(v * 8.99)))] for v in values)
+        return Text(line.rjust(width), style=color)
+
     def _get_mini_bar(self, val, color, width=10):
         w = int(val * width)
         bar = "█" * w + "░" * (width - w)
         return Text(bar, style=color)
 
-    def update(self, features, palette_name, device_name, track_name, hues=(0, 0, 0), saturation=255):
-        """Update and return the layout."""
+    def _get_pan_meter(self, pan, color, width=11):
+        """Center-marked L/R balance: the marker sits at `pan` (0 = left, 1 = right)."""
+        pos = min(width - 1, max(0, int(round(pan * (width - 1)))))
+        cells = ["·"] * width
+        cells[width // 2] = "┼"
+        cells[pos] = "●"
+        return Text("L" + "".join(cells) + "R", style=color)
+
+    def update(self, features, palette_name, device_name, track_name, hues=(0, 0, 0), saturation=255, history=None):
+        """
+        Update and return the layout.
+        
+        history: optional FeatureHistory; its loudness column drives the sparkline.
+        """
         
         h_b, h_m, h_t = hues
         c_b = self._hue_to_hex(h_b, saturation)
@@ -178,15 +193,26 @@ class TerminalDashboard:
         footer_table.add_column("V", justify="left")
         
         footer_table.add_row(
-            Text("BASS", style=c_b), self._get_mini_bar(features.get('bass',0), c_b),
-            Text("MID", style=c_m),  self._get_mini_bar(features.get('mid',0), c_m),
-            Text("TREB", style=c_t), self._get_mini_bar(features.get('treble',0), c_t)
+            Text("BASS", style=c_b), self._get_mini_bar(features.bass, c_b),
+            Text("MID", style=c_m),  self._get_mini_bar(features.mid, c_m),
+            Text("TREB", style=c_t), self._get_mini_bar(features.treble, c_t)
         )
         footer_table.add_row(
-            Text("RMS", style="white"), self._get_mini_bar(features.get('loudness_rms',0), "white"),
-            Text("GAIN", style="dim"), Text(f"{features.get('bass',0)*0.15 + 1.0:.2f}x", style="dim"),
+            Text("RMS", style="white"), self._get_mini_bar(features.loudness_rms, "white"),
+            Text("GAIN", style="dim"), Text(f"{features.bass*0.15 + 1.0:.2f}x", style="dim"),
             Text("SAT", style="dim"),  Text(f"{saturation/255.0:.2f}x", style="dim")
         )
+        loud_cells = (Text(""), Text(""))
+        if history is not None and len(history):
+            # Last ~10 s, strided down to the sparkline width (still a view)
+            n = history.frames_for(10.0)
+            loudness = history.column('loudness_rms', n)[::max(1, n // 30)]
+            loud_cells = (Text("LOUD", style="dim"), self._get_sparkline(loudness, c_mix, width=30))
+        footer_table.add_row(
+            *loud_cells,
+            Text("PAN", style="dim"), self._get_pan_meter(features.pan, c_mix),
+            Text(""), Text("")
+        )
         
         self.layout["footer"].update(Align.center(footer_table, vertical="middle"))
 
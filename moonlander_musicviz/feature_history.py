@@ -0,0 +1,50 @@
+"""Preallocated ring of recent FeatureFrames, readable as zero-copy numpy views."""
+import numpy as np
+from .audio_analyzer import FEATURE_KEYS
+
+HISTORY_DTYPE = np.dtype([('t', '<f8')] + [(k, '<f4') for k in FEATURE_KEYS])
+
+
+class FeatureHistory:
+    """
+    The last `seconds` of features at `rate` frames per second.
+
+    Every row is written twice (at i and i + capacity), so the newest n rows are
+    always one contiguous slice: view(n) and column(name, n) never copy. Views
+    are only valid until the next append() overwrites the oldest rows.
+    """
+
+    def __init__(self, seconds=60.0, rate=48000 / 1024):
+        self.rate = rate
+        self.capacity = max(1, int(seconds * rate))
+        self._buf = np.zeros(2 * self.capacity, dtype=HISTORY_DTYPE)
+        self._t = self._buf['t']
+        self._cols = [(k, self._buf[k]) for k in FEATURE_KEYS]
+        self.head = 0      # next write position in [0, capacity)
+        self.count = 0
+
+    def append(self, t, frame):
+        i = self.head
+        j = i + self.capacity
+        self._t[i] = self._t[j] = t
+        for k, col in self._cols:
+            col[i] = col[j] = getattr(frame, k)
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def view(self, n=None):
+        """Structured view of the newest n rows (oldest first)."""
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self._buf[end - n:end]
+
+    def column(self, name, n=None):
+        """View of one field ('t' or a feature) over the newest n rows."""
+        return self.view(n)[name]
+
+    def frames_for(self, seconds):
+        return int(seconds * self.rate)
@@ -1,115 +1,514 @@
 "QMK Raw HID sender: find device + send 32-byte packets."
 import hid
+import time
+import math
+import random
 import struct
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 USAGE_PAGE = 0xFF60
 USAGE_ID = 0x61
 MAGIC = 0x4D
 VERSION = 0x01
 
+# Latency echo: the host stamps bytes 24–29 (seq u16, host ms u32) and sets
+# FLAG_ECHO; the firmware answers with one ECHO_REPLY report per applied packet.
+FLAG_ECHO = 0x20
+ECHO_STAMP = struct.Struct("<HI")
+ECHO_STAMP_OFFSET = 24
+ECHO_TYPE = 0x45   # 'E' in byte 2 of a reply
+# magic, version, type, pad, seq, host ms, device rx ms, device apply ms
+ECHO_REPLY = struct.Struct("<BBBxHIII")
+
+
+def host_ms():
+    """Host timestamp carried in packets (monotonic, wraps at 2^32 ms)."""
+    return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+
+def decode_echo(data):
+    """Parse an echo report → (seq, host_ms, rx_ms, apply_ms), or None."""
+    if data is None or len(data) < ECHO_REPLY.size:
+        return None
+    magic, version, kind, seq, sent_ms, rx_ms, apply_ms = ECHO_REPLY.unpack(bytes(data[:ECHO_REPLY.size]))
+    if magic != MAGIC or version != VERSION or kind != ECHO_TYPE:
+        return None
+    return seq, sent_ms, rx_ms, apply_ms
+
+
+def encode_packet(audio_features, hue_bass=160, hue_mid=40, hue_treble=220, saturation=255):
+    """
+    Build a 32-byte music visualizer packet.
+    
+    Args:
+        audio_features: FeatureFrame (bass, mid, treble, loudness_rms, loudness_peak, beat,
+            and the per-channel bass_l … treble_r; all 0–1)
+        hue_*: hue values (0–255) for each band
+        saturation: global saturation (0-255)
+    """
+    pkt = bytearray(32)
+    
+    # Map loudness to master gain with a square curve for better contrast
+    # Quiet parts (loudness ~0.2) will be very dim (~10+10=20)
+    # Loud parts (loudness ~1.0) will be max brightness (10+245=255)
+    gain_curve = audio_features.loudness_rms ** 2.0
+    master_gain = int(10 + (gain_curve * 245))
+    
+    pkt[0] = MAGIC
+    pkt[1] = VERSION
+    pkt[2] = 0x15  # flags: enable=1, strobe_enable=0, safety_limit=1, debug=0, stereo=1
+    pkt[3] = master_gain
+    
+    # Audio features: convert 0–1 to 0–255
+    pkt[4] = int(audio_features.loudness_rms * 255)
+    pkt[5] = int(audio_features.loudness_peak * 255)
+    pkt[6] = int(audio_features.bass * 255)
+    pkt[7] = int(audio_features.mid * 255)
+    pkt[8] = int(audio_features.treble * 255)
+    pkt[9] = int(audio_features.beat * 255)
+    
+    # Hues and colors
+    pkt[10] = hue_bass
+    pkt[11] = hue_mid
+    pkt[12] = hue_treble
+    pkt[13] = saturation
+    pkt[14] = 128      # fx_speed (unused)
+    pkt[15] = int(audio_features.beat * 255)  # shockwave_strength
+    pkt[16] = int(audio_features.treble * 200)  # perimeter_sparkle (0–200)
+    pkt[17] = 30       # beat_refractory_ms (30 * 4 = 120ms)
+    
+    # Per-half levels (stereo flag 0x10): left half, then right half
+    pkt[18] = int(audio_features.bass_l * 255)
+    pkt[19] = int(audio_features.mid_l * 255)
+    pkt[20] = int(audio_features.treble_l * 255)
+    pkt[21] = int(audio_features.bass_r * 255)
+    pkt[22] = int(audio_features.mid_r * 255)
+    pkt[23] = int(audio_features.treble_r * 255)
+    
+    # Bytes 24–29: echo stamp, filled in per write by HIDSender; 30–31 stay 0
+    return pkt
+
+def find_devices(vendor_id=None, product_id=None):
+    """Return hid.enumerate() entries of every matching QMK Raw HID interface."""
+    found = []
+    for d in hid.enumerate():
+        # Filter by Usage Page/ID if specified
+        if vendor_id is not None and product_id is not None:
+            if d.get('vendor_id') != vendor_id or d.get('product_id') != product_id:
+                continue
+        if d.get('usage_page') == USAGE_PAGE and d.get('usage') == USAGE_ID:
+            found.append(d)
+    return found
+
+NOT_FOUND_MESSAGE = (
+    "QMK Raw HID device not found.\n"
+    "Ensure Moonlander is connected and firmware is flashed with RAW_ENABLE=yes."
+)
+
 class HIDSender:
     """
     Finds and communicates with a QMK Raw HID device.
     """
     
-    def __init__(self, vendor_id=None, product_id=None):
+    def __init__(self, vendor_id=None, product_id=None, device_info=None, device=None):
         """
         Find and open a QMK Raw HID device.
         
         If vendor_id/product_id are None, searches by Usage Page/ID (default).
+        device_info: an entry from find_devices() to open that interface only.
+        device: an already open device object (e.g. FakeHIDDevice) to use as is.
         """
         self.dev = None
+        self.name = None
         self.vendor_id = vendor_id
         self.product_id = product_id
-        self._find_and_open()
+        self.seq = 0
+        self.latency = LatencyStats()
+        if device is not None:
+            self.dev = device
+            self.name = getattr(device, 'name', "HID device")
+        elif device_info is not None:
+            if not self._open(device_info):
+                raise RuntimeError(f"Failed to open {device_info['path']}")
+        else:
+            self._find_and_open()
+        
+        # Echo replies are read here, never on the send path
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_replies, name="hid-echo", daemon=True)
+        self._reader.start()
+    
+    def _open(self, d):
+        try:
+            self.dev = hid.device()
+            self.dev.open_path(d['path'])
+            self.name = f"{d['manufacturer_string']} {d['product_string']}"
+            print(f"[HID] Opened: {self.name}")
+            return True
+        except Exception as e:
+            print(f"[HID] Failed to open {d['path']}: {e}")
+            self.dev = None
+            return False
     
     def _find_and_open(self):
         """Search for QMK Raw HID interface and open it."""
-        devices = hid.enumerate()
+        for d in find_devices(self.vendor_id, self.product_id):
+            if self._open(d):
+                return
         
-        for d in devices:
-            # Filter by Usage Page/ID if specified
-            if self.vendor_id is not None and self.product_id is not None:
-                if d.get('vendor_id') != self.vendor_id or d.get('product_id') != self.product_id:
-                    continue
-            
-            # Try matching by Usage Page/ID
-            if d.get('usage_page') == USAGE_PAGE and d.get('usage') == USAGE_ID:
-                try:
-                    self.dev = hid.device()
-                    self.dev.open_path(d['path'])
-                    print(f"[HID] Opened: {d['manufacturer_string']} {d['product_string']}")
-                    return
-                except Exception as e:
-                    print(f"[HID] Failed to open {d['path']}: {e}")
-                    continue
-        
-        raise RuntimeError(
-            "QMK Raw HID device not found.\n"
-            "Ensure Moonlander is connected and firmware is flashed with RAW_ENABLE=yes."
-        )
+        raise RuntimeError(NOT_FOUND_MESSAGE)
     
     def send_packet(self, audio_features, hue_bass=160, hue_mid=40, hue_treble=220, saturation=255):
         """
         Send a music visualizer packet to the Moonlander.
         
-        Args:
-            audio_features: dict with keys bass, mid, treble, loudness_rms, loudness_peak, beat (all 0–1)
-            hue_*: hue values (0–255) for each band
-            saturation: global saturation (0-255)
+        Args: see encode_packet()
         
         Returns:
-            True if successful, False on error
+            The 32-byte packet if successful, None on error
         """
+        if self.dev is None:
+            return None
+        
+        pkt = encode_packet(audio_features, hue_bass, hue_mid, hue_treble, saturation)
+        return pkt if self.write_packet(pkt) else None
+    
+    def write_packet(self, pkt):
+        """Write an already encoded packet. Returns True if successful."""
         if self.dev is None:
             return False
         
+        # Stamp a copy, so a shared packet (HIDSenderGroup) is never mutated
+        self.seq = (self.seq + 1) & 0xFFFF
+        data = list(pkt)
+        data[2] |= FLAG_ECHO
+        data[ECHO_STAMP_OFFSET:ECHO_STAMP_OFFSET + ECHO_STAMP.size] = ECHO_STAMP.pack(self.seq, host_ms())
         try:
-            # Build 32-byte packet
-            pkt = bytearray(32)
-            
-            # Map loudness to master gain with a square curve for better contrast
-            # Quiet parts (loudness ~0.2) will be very dim (~10+10=20)
-            # Loud parts (loudness ~1.0) will be max brightness (10+245=255)
-            gain_curve = audio_features['loudness_rms'] ** 2.0
-            master_gain = int(10 + (gain_curve * 245))
-            
-            pkt[0] = MAGIC
-            pkt[1] = VERSION
-            pkt[2] = 0x05  # flags: enable=1, strobe_enable=0, safety_limit=1, debug=0
-            pkt[3] = master_gain
-            
-            # Audio features: convert 0–1 to 0–255
-            pkt[4] = int(audio_features['loudness_rms'] * 255)
-            pkt[5] = int(audio_features['loudness_peak'] * 255)
-            pkt[6] = int(audio_features['bass'] * 255)
-            pkt[7] = int(audio_features['mid'] * 255)
-            pkt[8] = int(audio_features['treble'] * 255)
-            pkt[9] = int(audio_features['beat'] * 255)
-            
-            # Hues and colors
-            pkt[10] = hue_bass
-            pkt[11] = hue_mid
-            pkt[12] = hue_treble
-            pkt[13] = saturation
-            pkt[14] = 128      # fx_speed (unused)
-            pkt[15] = int(audio_features['beat'] * 255)  # shockwave_strength
-            pkt[16] = int(audio_features['treble'] * 200)  # perimeter_sparkle (0–200)
-            pkt[17] = 30       # beat_refractory_ms (30 * 4 = 120ms)
-            
-            # Pad rest with 0
-            for i in range(18, 32):
-                pkt[i] = 0
-            
-            self.dev.write(list(pkt))
+            self.dev.write(data)
+            self.latency.sent += 1
             return True
         
         except Exception as e:
             print(f"[HID] Write failed: {e}")
             return False
     
+    def _read_replies(self):
+        """Reader thread: turn echo reports into latency samples."""
+        dev = self.dev
+        while not self._stop.is_set():
+            try:
+                data = dev.read(32, 100)
+            except Exception:
+                # Device gone; failed writes report it
+                return
+            echo = decode_echo(data)
+            if echo is None:
+                continue
+            seq, sent_ms, rx_ms, apply_ms = echo
+            rtt = (host_ms() - sent_ms) & 0xFFFFFFFF
+            self.latency.add(float(rtt), float((apply_ms - rx_ms) & 0xFFFFFFFF))
+    
+    def latency_report(self):
+        """(name, LatencyStats) pairs; same shape as HIDSenderGroup.latency_report()."""
+        return [(self.name, self.latency)]
+    
     def close(self):
         """Close the HID device."""
         if self.dev:
+            self._stop.set()
+            self._reader.join(timeout=1.0)
             self.dev.close()
             self.dev = None
+
+
+class LatencyStats:
+    """
+    Rolling echo statistics of one keyboard (last `window` replies).
+    
+    rtt: host write → reply received (includes the wait for the next LED frame).
+    apply: device receive → LED frame rendered with the packet (device clock).
+    usb: one-way transfer estimate, (rtt - apply) / 2.
+    Packets replaced before the next frame are not echoed, so echoes <= sent.
+    """
+    
+    def __init__(self, window=512):
+        self.rtt = collections.deque(maxlen=window)
+        self.apply = collections.deque(maxlen=window)
+        self.sent = 0
+        self.echoes = 0
+    
+    def add(self, rtt_ms, apply_ms):
+        self.rtt.append(rtt_ms)
+        self.apply.append(apply_ms)
+        self.echoes += 1
+    
+    @staticmethod
+    def _percentile(values, q):
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+    
+    def summary(self):
+        """Percentiles in ms (None until the first echo)."""
+        rtt, apply = list(self.rtt), list(self.apply)
+        usb = [(r - a) / 2.0 for r, a in zip(rtt, apply)]
+        return {
+            'sent': self.sent,
+            'echoes': self.echoes,
+            'rtt_p50': self._percentile(rtt, 0.50),
+            'rtt_p95': self._percentile(rtt, 0.95),
+            'apply_p50': self._percentile(apply, 0.50),
+            'apply_p95': self._percentile(apply, 0.95),
+            'usb_p50': self._percentile(usb, 0.50),
+        }
+    
+    def __str__(self):
+        s = self.summary()
+        if s['rtt_p50'] is None:
+            return f"no echoes ({s['sent']} sent; firmware without echo support?)"
+        return (f"RTT p50 {s['rtt_p50']:.1f} ms / p95 {s['rtt_p95']:.1f} ms, "
+                f"apply p50 {s['apply_p50']:.1f} ms / p95 {s['apply_p95']:.1f} ms, "
+                f"USB ~{s['usb_p50']:.1f} ms ({s['echoes']}/{s['sent']} echoed)")
+
+
+class FakeHIDDevice:
+    """
+    In-process stand-in for a keyboard running the musicviz firmware.
+    
+    Implements the part of the hidapi device interface HIDSender uses
+    (write / read / close) and answers like the firmware does: each packet
+    arrives after `usb_ms`, is applied on the next LED frame (every
+    `frame_ms`), and the echo of the newest packet applied in that frame
+    comes back after another `usb_ms`. Lets the latency path run without
+    hardware; pass it as HIDSender(device=FakeHIDDevice()).
+    """
+    
+    def __init__(self, usb_ms=1.0, frame_ms=16.0, jitter_ms=0.3, seed=None):
+        self.name = "Fake musicviz keyboard"
+        self.usb_ms = usb_ms
+        self.frame_ms = frame_ms
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+        self.packets = 0
+        self.last_packet = None
+        self._t0 = time.monotonic()
+        self._cond = threading.Condition()
+        self._replies = collections.deque()   # (ready_at, apply_at, report)
+        self._closed = False
+    
+    def _device_ms(self, t):
+        return int((t - self._t0) * 1000) & 0xFFFFFFFF
+    
+    def _transfer(self):
+        return (self.usb_ms + self.rng.uniform(0.0, self.jitter_ms)) / 1000.0
+    
+    def write(self, data):
+        if self._closed:
+            raise OSError("device closed")
+        self.packets += 1
+        self.last_packet = bytes(data)
+        if len(data) < 32 or data[0] != MAGIC or data[1] != VERSION or not data[2] & FLAG_ECHO:
+            return len(data)
+        
+        seq, sent_ms = ECHO_STAMP.unpack(bytes(data[ECHO_STAMP_OFFSET:ECHO_STAMP_OFFSET + ECHO_STAMP.size]))
+        rx_at = time.monotonic() + self._transfer()
+        frame = self.frame_ms / 1000.0
+        apply_at = self._t0 + math.ceil((rx_at - self._t0) / frame) * frame
+        report = ECHO_REPLY.pack(MAGIC, VERSION, ECHO_TYPE, seq, sent_ms,
+                                 self._device_ms(rx_at), self._device_ms(apply_at))
+        with self._cond:
+            # Only the newest packet of a frame is applied (and echoed)
+            if self._replies and self._replies[-1][1] == apply_at:
+                self._replies.pop()
+            self._replies.append((apply_at + self._transfer(), apply_at, report + bytes(32 - len(report))))
+            self._cond.notify()
+        return len(data)
+    
+    def read(self, max_length, timeout_ms=0):
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                if self._replies and self._replies[0][0] <= now:
+                    return list(self._replies.popleft()[2][:max_length])
+                wait = deadline - now
+                if self._replies:
+                    wait = min(wait, self._replies[0][0] - now)
+                if wait <= 0 and now >= deadline:
+                    return []
+                self._cond.wait(max(wait, 0.0))
+        return []
+    
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class _DeviceChannel:
+    """One keyboard inside an HIDSenderGroup, with its health counters."""
+    
+    def __init__(self, info):
+        self.info = info
+        self.path = info['path']
+        self.sender = None
+        self.busy = False          # a write is in flight
+        self.failures = 0          # consecutive failed writes
+        self.writes = 0
+        self.dropped = 0           # packets skipped because the board was still busy
+        self.latency_ms = 0.0      # EMA of write duration
+        self.last_ok = 0.0
+        self.backoff = 0.0         # seconds before the next reopen attempt
+        self.retry_at = 0.0
+    
+    @property
+    def live_sender(self):
+        """The open HIDSender, or None. Pool threads may drop it at any time,
+        so callers read it once and use the local."""
+        sender = self.sender
+        return sender if sender is not None and sender.dev is not None else None
+    
+    @property
+    def connected(self):
+        return self.live_sender is not None
+
+
+class HIDSenderGroup:
+    """
+    Sends every packet to all matching QMK Raw HID interfaces.
+    
+    The packet is encoded once and each board is written from a small thread pool.
+    A board that is still busy with its previous write skips the new packet, so a
+    slow or unplugged keyboard never delays the others. Boards that fail repeatedly
+    are closed and picked up again by a periodic background rescan.
+    
+    Same interface as HIDSender (send_packet / write_packet / close).
+    """
+    
+    MAX_FAILURES = 3
+    
+    def __init__(self, vendor_id=None, product_id=None, max_workers=4, rescan_interval=2.0):
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.rescan_interval = rescan_interval
+        self.channels = {}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hid")
+        self._rescanning = False
+        self._last_rescan = time.monotonic()
+        
+        self._rescan()
+        if not self.channels:
+            self.pool.shutdown()
+            raise RuntimeError(NOT_FOUND_MESSAGE)
+        self.name = f"{len(self.channels)} keyboards"
+    
+    def _rescan(self):
+        """
+        Open interfaces that are new or were dropped after failures, and forget
+        dropped boards whose path is gone (a replugged board may get a new path).
+        """
+        try:
+            channels = {}
+            for d in find_devices(self.vendor_id, self.product_id):
+                ch = self.channels.get(d['path']) or _DeviceChannel(d)
+                channels[d['path']] = ch
+                if not ch.connected and time.monotonic() >= ch.retry_at:
+                    try:
+                        ch.sender = HIDSender(device_info=d)
+                        ch.failures = 0
+                    except RuntimeError:
+                        ch.sender = None
+            # Vanished boards stay until their writes fail and close them
+            for path, ch in list(self.channels.items()):
+                if path not in channels and (ch.connected or ch.busy):
+                    channels[path] = ch
+            # One rebinding: the audio thread iterates the old or the new dict, never a half-updated one
+            self.channels = channels
+        finally:
+            self._rescanning = False
+    
+    def _write(self, ch, pkt):
+        started = time.perf_counter()
+        sender = ch.live_sender
+        try:
+            if sender is None:
+                return
+            if sender.write_packet(pkt):
+                ch.writes += 1
+                ch.failures = 0
+                ch.backoff = 0.0
+                ch.last_ok = time.monotonic()
+                ms = (time.perf_counter() - started) * 1000.0
+                ch.latency_ms = ms if ch.writes == 1 else 0.9 * ch.latency_ms + 0.1 * ms
+            else:
+                ch.failures += 1
+                if ch.failures >= self.MAX_FAILURES:
+                    print(f"[HID] Dropping {sender.name} until it reappears")
+                    ch.sender = None
+                    sender.close()
+                    # Boards that open but keep failing are retried less and less often
+                    ch.backoff = min(30.0, max(1.0, ch.backoff * 2))
+                    ch.retry_at = time.monotonic() + ch.backoff
+        finally:
+            ch.busy = False
+    
+    def send_packet(self, audio_features, hue_bass=160, hue_mid=40, hue_treble=220, saturation=255):
+        """Encode once and fan out. Returns the packet if at least one board is connected."""
+        pkt = encode_packet(audio_features, hue_bass, hue_mid, hue_treble, saturation)
+        return pkt if self.write_packet(pkt) else None
+    
+    def write_packet(self, pkt):
+        """Queue pkt for every connected board without waiting for the writes."""
+        any_connected = False
+        # list(): the background rescan may add channels meanwhile
+        for ch in list(self.channels.values()):
+            if not ch.connected:
+                continue
+            any_connected = True
+            if ch.busy:
+                ch.dropped += 1
+                continue
+            ch.busy = True
+            self.pool.submit(self._write, ch, pkt)
+        
+        now = time.monotonic()
+        if now - self._last_rescan > self.rescan_interval and not self._rescanning:
+            # Periodic: picks up both reconnected and newly plugged-in boards
+            self._last_rescan = now
+            self._rescanning = True
+            self.pool.submit(self._rescan)
+        
+        return any_connected
+    
+    def health(self):
+        """Per-device status for display/logging."""
+        report = []
+        for ch in list(self.channels.values()):
+            sender = ch.live_sender
+            report.append({
+                'path': ch.path,
+                'name': sender.name if sender is not None else None,
+                'connected': sender is not None,
+                'writes': ch.writes,
+                'dropped': ch.dropped,
+                'failures': ch.failures,
+                'latency_ms': ch.latency_ms,
+                'echo': sender.latency.summary() if sender is not None else None,
+            })
+        return report
+    
+    def latency_report(self):
+        """(name, LatencyStats) of every connected board."""
+        senders = [ch.live_sender for ch in list(self.channels.values())]
+        return [(s.name, s.latency) for s in senders if s is not None]
+    
+    def close(self):
+        """Wait for in-flight writes and close every device."""
+        self.pool.shutdown(wait=True)
+        for ch in list(self.channels.values()):
+            sender, ch.sender = ch.sender, None
+            if sender is not None:
+                sender.close()
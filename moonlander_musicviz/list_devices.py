@@ -24,6 +24,8 @@ def main():
     print("1. Set your system output to a Multi-Output device (Speakers + BlackHole)")
     print("2. Run: mise run run")
     print("   The script will auto-detect BlackHole as input device")
+    print("   Other devices (e.g. a PulseAudio/PipeWire monitor on Linux):")
+    print("   python -m moonlander_musicviz.main --input device:<name or index>")
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,56 @@
-"Main CLI: capture audio from BlackHole → analyze → send to Moonlander."
+"Main CLI: capture audio from BlackHole (or another source) → analyze → send to Moonlander."
 import time
+_STARTED = time.perf_counter()   # before the heavy imports, so the startup report includes them
+
+import atexit
 import signal
 import argparse
 import random
-import sounddevice as sd
-import numpy as np
-from .audio_analyzer import AudioAnalyzer
-from .hid_sender import HIDSender
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from .audio_analyzer import AudioAnalyzer, FeatureFrame
+from .feature_history import FeatureHistory
+from .scene_detector import SceneDetector
+from .audio_sources import (SoundDeviceSource, WallClock, VirtualClock, find_input_device,
+                            open_source, query_devices)
+from .hid_sender import HIDSender, HIDSenderGroup, FakeHIDDevice, encode_packet
 from .track_info import TrackInfo
 
-def find_blackhole_device():
+class StartupTimer:
+    """
+    Startup phases in ms, from module import to the first packet ("first light").
+    Phases started from the probe threads overlap; "probe" is their wall time.
+    """
+    
+    def __init__(self, started):
+        self.started = started
+        self.phases = []
+        self.first_light_ms = None
+    
+    def add(self, name, seconds):
+        self.phases.append((name, seconds * 1000.0))
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+    
+    def mark_first_light(self):
+        self.first_light_ms = (time.perf_counter() - self.started) * 1000.0
+    
+    def report(self):
+        parts = " | ".join(f"{name} {ms:.0f}" for name, ms in self.phases)
+        return f"[*] Startup (ms): {parts} | first light {self.first_light_ms:.0f}"
+
+def find_blackhole_device(devices=None):
     """Find BlackHole input device index."""
-    devices = sd.query_devices()
-    for i, d in enumerate(devices):
-        if "BlackHole" in d["name"] and d["max_input_channels"] > 0:
-            return i
+    try:
+        return find_input_device("BlackHole", devices)
+    except RuntimeError:
+        pass
     
     raise RuntimeError(
         "BlackHole device not found.\n"
@@ -30,57 +66,176 @@ def main():
     
     parser = argparse.ArgumentParser()
     parser.add_argument("--screen", action="store_true", help="Sync colors with screen content")
+    parser.add_argument("--shm", action="store_true",
+                        help="Run headless and publish features to shared memory for `moonlander_musicviz.ui`")
+    parser.add_argument("--shm-name", default=None, help="Shared memory name (default: moonlander_musicviz)")
+    parser.add_argument("--record", metavar="PATH", help="Record every analysis frame to a session file")
+    parser.add_argument("--all-keyboards", action="store_true",
+                        help="Drive every connected QMK board with the musicviz firmware")
+    parser.add_argument("--broadcast", nargs="?", const="239.255.77.77:5077", metavar="HOST:PORT",
+                        help="Broadcast features over UDP for `moonlander_musicviz.net_client` (default group 239.255.77.77:5077)")
+    parser.add_argument("--no-track-cache", action="store_true", help="Disable the per-track beat/section cache")
+    parser.add_argument("--input", metavar="SOURCE",
+                        help="Audio source: device:<name|index>, a .wav file, raw:<file> or - (raw f32 stereo on stdin). "
+                             "Default: BlackHole")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="File/stdin sources: playback speed (1 = real time, 0 = as fast as possible)")
+    parser.add_argument("--loop", action="store_true", help="Loop a WAV file source")
+    parser.add_argument("--seed", type=int, default=None, help="Seed palette selection (reproducible replays)")
+    parser.add_argument("--mono", action="store_true",
+                        help="Analyze a mono downmix only (both keyboard halves show the same levels)")
+    parser.add_argument("--headless", action="store_true", help="No dashboard")
+    parser.add_argument("--no-hid", action="store_true", help="Do not open a keyboard (load tests, CI)")
+    parser.add_argument("--fake-hid", action="store_true",
+                        help="Send to an in-process fake keyboard that echoes like the firmware (latency tests)")
     args = parser.parse_args()
 
     print("[*] Moonlander Music Visualizer (macOS)")
     if args.screen:
         print("[*] Mode: Screen Color Sync")
-    print("[*] Finding BlackHole device...")
     
-    try:
-        device_id = find_blackhole_device()
-        device_name = sd.query_devices()[device_id]['name']
-        print(f"[+] Using device: {device_name}")
-    except RuntimeError as e:
-        print(f"[-] Error: {e}")
-        return
-    
-    print("[*] Opening QMK Raw HID...")
-    try:
-        sender = HIDSender()
-    except RuntimeError as e:
-        print(f"[-] Error: {e}")
-        return
+    sr = 48000
+    hop = 1024
+    startup = StartupTimer(_STARTED)
+    startup.add("imports", time.perf_counter() - _STARTED)
+    show_dashboard = not args.shm and not args.headless
+    
+    # Device probing, analyzer warm-up and the Rich import overlap:
+    # each is mostly waiting on PortAudio, USB enumeration or imports.
+    def probe_audio():
+        with startup.phase("audio"):
+            if args.input:
+                return open_source(args.input, sr=sr, hop=hop, loop=args.loop)
+            print("[*] Finding BlackHole device...")
+            devices = query_devices()
+            return SoundDeviceSource(find_blackhole_device(devices), sr=sr, hop=hop, devices=devices)
+    
+    def probe_hid():
+        with startup.phase("hid"):
+            if args.fake_hid:
+                return HIDSender(device=FakeHIDDevice(seed=args.seed))
+            if args.no_hid:
+                return None
+            print("[*] Opening QMK Raw HID...")
+            return HIDSenderGroup() if args.all_keyboards else HIDSender()
+    
+    def warm_analyzer():
+        with startup.phase("analyzer"):
+            return AudioAnalyzer(sr=sr, nfft=2048, hop=hop, stereo=not args.mono).prewarm()
+    
+    def load_dashboard():
+        with startup.phase("dashboard"):
+            from .dashboard import TerminalDashboard
+            return TerminalDashboard()
+    
+    with startup.phase("probe"), ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup") as pool:
+        audio_job = pool.submit(probe_audio)
+        hid_job = pool.submit(probe_hid)
+        analyzer_job = pool.submit(warm_analyzer)
+        dashboard_job = pool.submit(load_dashboard) if show_dashboard else None
+        
+        sender, hid_error = None, None
+        try:
+            sender = hid_job.result()
+        except RuntimeError as e:
+            hid_error = e
+        try:
+            source = audio_job.result()
+        except (RuntimeError, OSError, EOFError) as e:
+            print(f"[-] Error: {e}")
+            file_input = args.input and args.input != "-" and not args.input.startswith(("device:", "raw:"))
+            if isinstance(e, RuntimeError) and file_input:
+                # A file the WAV reader could not decode
+                print(f"[*] Convert it with ffmpeg and use raw: or stdin, e.g. "
+                      f"ffmpeg -i {args.input} -f f32le -ac 2 -ar {sr} - | ... --input -")
+            if sender is not None:
+                sender.close()
+            return
+        analyzer = analyzer_job.result()
+        dashboard = dashboard_job.result() if dashboard_job is not None else None
+    setup_started = time.perf_counter()
+    
+    device_name = source.name
+    print(f"[+] Using device: {device_name}")
+    if hid_error is not None:
+        if not args.broadcast:
+            print(f"[-] Error: {hid_error}")
+            return
+        # A broadcast server does not need a keyboard of its own
+        print("[*] No local keyboard; broadcasting only")
+    
+    if source.sr != sr:
+        sr = source.sr
+        analyzer = AudioAnalyzer(sr=sr, nfft=2048, hop=hop, stereo=not args.mono).prewarm()
+    
+    # Live capture is paced by the device; files/stdin by a virtual clock, so
+    # the whole pipeline (modulation, palettes, packets) is reproducible.
+    clock = WallClock() if source.realtime else VirtualClock(speed=args.speed)
+    rng = random.Random(args.seed)
+    
+    broadcaster = None
+    if args.broadcast:
+        from .net_broadcast import FeatureBroadcaster
+        broadcaster = FeatureBroadcaster(args.broadcast)
+        print(f"[+] Broadcasting features to {args.broadcast}")
     
     print("[*] Starting audio capture...")
     
-    sr = 48000
-    hop = 1024
-    analyzer = AudioAnalyzer(sr=sr, nfft=2048, hop=hop)
+    # Shared by the dashboard sparkline (and anything else that needs recent features)
+    history = FeatureHistory(seconds=60.0, rate=sr / hop)
+    # Modulated copy of the analyzer output that is actually sent
+    visual = FeatureFrame()
+    scene = SceneDetector(history)
+    scene_change = False
     
     # Import new modules
-    from .dashboard import TerminalDashboard
     from .palettes import PALETTES, PALETTE_NAMES
-    from rich.live import Live
     
-    if args.screen:
+    # Shared-memory split: the dashboard (and screen capture) live in another process
+    ring = None
+    if args.shm:
+        from .shared_features import SharedFeatureRing, DEFAULT_NAME
+        try:
+            ring = SharedFeatureRing.create(args.shm_name or DEFAULT_NAME, device_name=device_name)
+        except RuntimeError as e:
+            print(f"[-] Error: {e}")
+            if sender is not None:
+                sender.close()
+            if broadcaster is not None:
+                broadcaster.close()
+            return
+        print(f"[+] Publishing to shared memory '{args.shm_name or DEFAULT_NAME}'")
+        print("[*] Attach a dashboard with: python -m moonlander_musicviz.ui")
+    
+    recorder = None
+    if args.record:
+        from .session_recorder import SessionRecorder
+        recorder = SessionRecorder(args.record, palette_names=PALETTE_NAMES, sr=sr, hop=hop)
+        print(f"[+] Recording session to {args.record}")
+    
+    if args.screen and ring is None:
         from .screen_analyzer import ScreenAnalyzer
         screen_analyzer = ScreenAnalyzer()
     
-    dashboard = TerminalDashboard()
-    track_info = TrackInfo()
-    current_track_name = "Waiting..."
-    last_track_check = 0.0
+    # Music.app only describes what the live input is playing
+    track_info = TrackInfo() if source.realtime else None
+    track_sync = None
+    if track_info is not None and not args.no_track_cache:
+        from .track_cache import TrackCache, TrackSync
+        track_sync = TrackSync(TrackCache())
+    current_track_name = "Waiting..." if track_info is not None else source.name
+    last_track_check = -1e9
     
     frame_count = 0
+    hop_count = 0
     update_rate_hz = 30
     update_interval = 1.0 / update_rate_hz
-    last_update = time.time()
+    # Due immediately: the first hop already lights the keyboard
+    last_update = clock.now() - update_interval
     
     # === Visual State ===
     hue_rotation = 0.0
     palette_index = 0
-    last_palette_switch = time.time()
     current_p_name = PALETTE_NAMES[palette_index]
     
     # Rhythm Modulation State (Smoothing/Decay)
@@ -88,51 +243,106 @@ def main():
     mod_saturation = 1.0
     mod_treble_boost = 0.0
     
+    def shutdown():
+        if sender is not None:
+            sender.close()
+        if broadcaster is not None:
+            broadcaster.close()
+        if ring is not None:
+            ring.close()
+        if recorder is not None:
+            recorder.close()
+        if track_sync is not None:
+            track_sync.close()
+    
+    def print_latency(latency):
+        for name, stats in latency:
+            print(f"[HID] {name}: {stats}")
+    
     def signal_handler(sig, frame):
-        # We don't print here to avoid breaking the dashboard layout
-        sender.close()
+        # We don't print here to avoid breaking the dashboard layout;
+        # the latency report is taken before shutdown() closes the boards
+        if sender is not None:
+            atexit.register(print_latency, sender.latency_report())
+        shutdown()
         exit(0)
     
     signal.signal(signal.SIGINT, signal_handler)
     
-    with sd.InputStream(device=device_id, channels=2, samplerate=sr,
-                        blocksize=hop, dtype='float32') as stream:
+    wall_start = time.perf_counter()
+    startup.add("setup", wall_start - setup_started)
+    
+    with source:
+        startup.add("stream", time.perf_counter() - wall_start)
         
-        # Use Rich Live Display
-        with Live(dashboard.layout, refresh_per_second=30, screen=True) as live:
+        # Use Rich Live Display (none when headless or the UI runs in its own process)
+        if show_dashboard:
+            from rich.live import Live
+            display = Live(dashboard.layout, refresh_per_second=30, screen=True)
+        else:
+            display = contextlib.nullcontext()
+        with display as live:
             while True:
                 # Read audio frame
-                audio, _ = stream.read(hop)
+                audio = source.read(hop)
+                if audio is None:
+                    break
                 features = analyzer.update(audio)
+                clock.advance(hop / sr)
+                hop_count += 1
                 
                 # Send to keyboard at fixed rate (~30 Hz)
-                now = time.time()
+                now = clock.now()
                 dt = now - last_update
+                history.append(now, features)
+                if scene.update(now, features.kick):
+                    # Latched until the next send
+                    scene_change = True
+                
+                if recorder is not None:
+                    recorder.append(now, features)
+                if track_sync is not None:
+                    track_sync.on_hop(now, features, scene.boundary)
                 
                 if dt >= update_interval:
+                    visual.copy_from(features)
                     
                     # Check Track Info (every 5.0s)
-                    if now - last_track_check > 5.0:
-                        current_track_name = track_info.get_current_track()
+                    if track_info is not None and now - last_track_check > 5.0:
+                        current_track_name, track_pos, track_len = track_info.get_state()
+                        if track_sync is not None:
+                            track_sync.on_track_state(current_track_name, track_pos, track_len, now)
                         last_track_check = now
 
+                    # Cached track: predicted beat / section boundary before the next send?
+                    beat_due = section_due = False
+                    t_section = None
+                    if track_sync is not None:
+                        t_beat = track_sync.time_to_beat(now)
+                        t_section = track_sync.time_to_section(now)
+                        beat_due = t_beat is not None and t_beat < update_interval
+                        section_due = t_section is not None and t_section < update_interval
+                        if beat_due:
+                            # Fire the shockwave on the grid even if the live onset is late
+                            visual.beat = 1.0
+
                     # --- Rhythm Modulation (Pre-Processing) ---
                     # Tuned down for subtlety (Less is more)
                     
                     # 1. Kick -> Master Gain (Very subtle pulse)
-                    if features.get('kick', 0) > 0.5:
+                    if visual.kick > 0.5:
                         mod_master_gain = 1.15 
                     else:
                         mod_master_gain = max(1.0, mod_master_gain - 2.0 * dt) # Faster decay
                     
                     # 2. Snare -> Saturation (Mild desaturation, not full bleach)
-                    if features.get('snare', 0) > 0.5:
+                    if visual.snare > 0.5:
                         mod_saturation = 0.7 
                     else:
                         mod_saturation = min(1.0, mod_saturation + 2.5 * dt) # Fast recovery
                     
                     # 3. Hi-Hat -> Treble Boost (Tiny sparkle)
-                    if features.get('hihat', 0) > 0.5:
+                    if visual.hihat > 0.5:
                         mod_treble_boost = 0.2
                     else:
                         mod_treble_boost = max(0.0, mod_treble_boost - 2.0 * dt)
@@ -140,34 +350,42 @@ def main():
                     # Apply Modulations to Features
                     # Master Gain is handled by sending it in the packet, 
                     # but here we can modulate the band levels directly too.
-                    features['bass']   = np.clip(features['bass'] * mod_master_gain, 0, 1.0)
-                    features['treble'] = np.clip(features['treble'] + mod_treble_boost, 0, 1.0)
+                    visual.bass   = min(visual.bass * mod_master_gain, 1.0)
+                    visual.treble = min(visual.treble + mod_treble_boost, 1.0)
+                    visual.bass_l   = min(visual.bass_l * mod_master_gain, 1.0)
+                    visual.bass_r   = min(visual.bass_r * mod_master_gain, 1.0)
+                    visual.treble_l = min(visual.treble_l + mod_treble_boost, 1.0)
+                    visual.treble_r = min(visual.treble_r + mod_treble_boost, 1.0)
                     
                     final_saturation = int(255 * mod_saturation)
                     
+                    screen_palette = None
                     if args.screen:
-                        h_b, h_m, h_t, screen_sat = screen_analyzer.get_palette()
+                        if ring is not None:
+                            # Published by the UI process; None until it attaches with --screen
+                            screen_palette = ring.read_screen_palette()
+                        else:
+                            screen_palette = screen_analyzer.get_palette()
+
+                    if screen_palette is not None:
+                        h_b, h_m, h_t, screen_sat = screen_palette
                         current_p_name = "Screen Sync"
                         final_saturation = int(screen_sat * mod_saturation)
                     else:
-                        # --- Palette Switching Logic (Expert Tuned) ---
-                        impact_score = (
-                            features.get('kick', 0) * 0.6 + 
-                            features.get('bass', 0) * 0.2 +
-                            features.get('treble', 0) * 0.2
-                        )
-                        
-                        time_since_last = now - last_palette_switch
-                        
-                        # Trigger: High impact or 45s timeout
-                        if (impact_score > 0.85 and time_since_last > 4.0) or (time_since_last > 45.0):
+                        # --- Palette Switching Logic ---
+                        if current_p_name not in PALETTES:
+                            # Screen palette went away (UI detached)
+                            current_p_name = PALETTE_NAMES[palette_index]
+
+                        # Trigger: cached section boundary when the track is known,
+                        # otherwise a live scene change (includes the 45s fallback)
+                        if section_due or (scene_change and t_section is None):
                             # Transition: "Blackout" effect (Lumiere's scene change)
                             mod_master_gain = 0.0 # Force instant darkness
                             
                             # Random selection (excluding current)
                             others = [n for n in PALETTE_NAMES if n != current_p_name]
-                            current_p_name = random.choice(others)
-                            last_palette_switch = now
+                            current_p_name = rng.choice(others)
 
                         active_palette = PALETTES[current_p_name]
                         base_hues = active_palette["hues"]
@@ -176,8 +394,8 @@ def main():
                         
                         # --- Dynamic Hue Rotation ---
                         if p_rot:
-                            speed = 0.5 + (features['loudness_rms'] * 2.0)
-                            if features['kick'] > 0.5:
+                            speed = 0.5 + (visual.loudness_rms * 2.0)
+                            if visual.kick > 0.5:
                                 hue_rotation += 3.0
                             hue_rotation = (hue_rotation + speed) % 255.0
                         else:
@@ -192,15 +410,43 @@ def main():
                         final_saturation = int(p_sat * mod_saturation)
 
                     # Send Packet via HID
-                    # We also send the modulated master_gain via features['master_gain'] if needed, 
+                    # We could also send the modulated master_gain in the packet, 
                     # but modulating band values directly is often more predictable.
-                    sender.send_packet(features, hue_bass=h_b, hue_mid=h_m, hue_treble=h_t, saturation=final_saturation)
+                    # Encoded even without a keyboard, so recordings always hold the packet
+                    pkt = encode_packet(visual, hue_bass=h_b, hue_mid=h_m, hue_treble=h_t, saturation=final_saturation)
+                    if sender is not None:
+                        sender.write_packet(pkt)
+                    if broadcaster is not None:
+                        broadcaster.send(visual, (h_b, h_m, h_t), final_saturation)
+                    if recorder is not None:
+                        recorder.mark_sent(current_p_name, (h_b, h_m, h_t), final_saturation, pkt)
                     
                     # Update Dashboard
-                    live.update(dashboard.update(features, current_p_name, device_name, current_track_name, hues=(h_b, h_m, h_t)))
+                    if ring is not None:
+                        ring.publish(now, visual, current_p_name, current_track_name, (h_b, h_m, h_t), final_saturation)
+                    elif show_dashboard:
+                        live.update(dashboard.update(visual, current_p_name, device_name, current_track_name, hues=(h_b, h_m, h_t), history=history))
                     
+                    if startup.first_light_ms is None:
+                        startup.mark_first_light()
+                        if show_dashboard:
+                            # Printed once the dashboard has released the terminal
+                            atexit.register(print, startup.report())
+                        else:
+                            print(startup.report())
+                    
+                    scene_change = False
                     last_update = now
                     frame_count += 1
+    
+    # Only reached when a file/stdin source ends
+    latency = sender.latency_report() if sender is not None else []
+    shutdown()
+    wall = time.perf_counter() - wall_start
+    audio_s = hop_count * hop / sr
+    print(f"[+] End of input: {hop_count} hops, {frame_count} packets, "
+          f"{audio_s:.1f}s audio in {wall:.2f}s ({audio_s / max(wall, 1e-9):.1f}x real time)")
+    print_latency(latency)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,218 @@
+"""UDP feature broadcast: one analyzing host → many keyboard hosts."""
+import math
+import time
+import socket
+import struct
+import ipaddress
+import collections
+from .audio_analyzer import FEATURE_KEYS, FeatureFrame
+
+DEFAULT_ADDRESS = "239.255.77.77:5077"
+FRAME_MAGIC = b"MVNF"
+FRAME_VERSION = 2
+
+# magic, version, pad, seq, sender time, FEATURE_KEYS (0–255 each), 3 hues, saturation
+N_FEATURES = len(FEATURE_KEYS)
+FRAME = struct.Struct(f"<4sBxId{N_FEATURES}B3BB")
+
+# One-shot triggers: never interpolated, never dropped between two samples
+IMPULSE_KEYS = ('beat', 'kick', 'snare', 'hihat')
+LEVEL_KEYS = tuple(k for k in FEATURE_KEYS if k not in IMPULSE_KEYS)
+
+
+def parse_address(address):
+    """'host:port' → (host, port, is_multicast)."""
+    host, _, port = address.rpartition(":")
+    host = host or "127.0.0.1"
+    try:
+        multicast = ipaddress.ip_address(host).is_multicast
+    except ValueError:
+        multicast = False
+    return host, int(port), multicast
+
+
+def encode_frame(seq, t, features, hues, saturation):
+    return FRAME.pack(
+        FRAME_MAGIC, FRAME_VERSION, seq & 0xFFFFFFFF, t,
+        *(max(0, min(255, int(getattr(features, k) * 255))) for k in FEATURE_KEYS),
+        hues[0], hues[1], hues[2], saturation
+    )
+
+
+class NetFrame:
+    """A decoded broadcast frame with its FeatureFrame."""
+    __slots__ = ('seq', 't', 'features', 'hues', 'saturation')
+
+    def __init__(self, seq, t, features, hues, saturation):
+        self.seq = seq
+        self.t = t
+        self.features = features
+        self.hues = hues
+        self.saturation = saturation
+
+
+def decode_frame(data):
+    """Return a NetFrame, or None for foreign/garbled datagrams."""
+    if len(data) != FRAME.size:
+        return None
+    fields = FRAME.unpack(data)
+    if fields[0] != FRAME_MAGIC or fields[1] != FRAME_VERSION:
+        return None
+    features = FeatureFrame()
+    end = 4 + N_FEATURES
+    for k, v in zip(FEATURE_KEYS, fields[4:end]):
+        setattr(features, k, v / 255.0)
+    return NetFrame(fields[2], fields[3], features, tuple(fields[end:end + 3]), fields[end + 3])
+
+
+class FeatureBroadcaster:
+    """Sends one frame per packet to a multicast group or a unicast address."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, ttl=1):
+        host, port, multicast = parse_address(address)
+        self.target = (host, port)
+        self.seq = 0
+        self.errors = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if multicast:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            # Also deliver to clients on this host (handy for testing)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.sock.setblocking(False)
+
+    def send(self, features, hues, saturation, t=None):
+        # Stamped with the wall clock by default: clients expect sender time to only move forward
+        pkt = encode_frame(self.seq, time.time() if t is None else t, features, hues, saturation)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        try:
+            self.sock.sendto(pkt, self.target)
+        except OSError:
+            # Never let the network stall or break the audio loop
+            self.errors += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class FeatureReceiver:
+    """Non-blocking receiver for FeatureBroadcaster frames."""
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        host, port, multicast = parse_address(address)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Several clients on one host may share the port
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if multicast:
+            self.sock.bind(("", port))
+            mreq = struct.pack("4s4s", socket.inet_aton(host), socket.inet_aton("0.0.0.0"))
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        else:
+            self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv_all(self):
+        """Drain the socket; returns [(NetFrame, local receive time)]."""
+        out = []
+        while True:
+            try:
+                data = self.sock.recv(256)
+            except (BlockingIOError, InterruptedError):
+                return out
+            frame = decode_frame(data)
+            if frame is not None:
+                out.append((frame, time.time()))
+
+    def close(self):
+        self.sock.close()
+
+
+class FrameInterpolator:
+    """
+    Playout buffer for a client.
+
+    Frames are played `delay` seconds behind the sender's clock. Level features are
+    linearly interpolated between the two frames around the playout time, which
+    bridges lost packets; impulses (beat/kick/...) from every frame that passed
+    since the previous sample are kept. If the stream stops, levels decay and
+    sample() returns None after `timeout` so the firmware fades out on its own.
+    """
+
+    def __init__(self, delay=0.05, timeout=0.5, decay=0.2):
+        self.delay = delay
+        self.timeout = timeout
+        self.decay = decay
+        self.frames = collections.deque(maxlen=32)
+        self.offsets = collections.deque(maxlen=128)
+        self.last_seq = None
+        self.last_recv = None
+        self.last_target = None
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+
+    def push(self, frame, recv_time):
+        if self.last_seq is not None:
+            ahead = (frame.seq - self.last_seq) & 0xFFFFFFFF
+            if ahead == 0 or ahead >= 0x80000000:
+                restarted = ((self.frames and abs(frame.t - self.frames[-1].t) > 1.0) or
+                             recv_time - self.last_recv > self.timeout)
+                if restarted:
+                    # Sender restarted: sequence numbers (and maybe its clock) began again
+                    self.frames.clear()
+                    self.offsets.clear()
+                else:
+                    self.late += 1  # duplicate or reordered behind newer data
+                    return
+            else:
+                self.lost += ahead - 1
+        self.last_seq = frame.seq
+        self.last_recv = recv_time
+        self.received += 1
+        self.frames.append(frame)
+        # Smallest observed (receive − send) ≈ clock offset + minimum network delay
+        self.offsets.append(recv_time - frame.t)
+
+    def sample(self, now):
+        """Return (FeatureFrame, hues, saturation) for local time `now`, or None."""
+        if not self.frames:
+            return None
+        target = now - min(self.offsets) - self.delay
+        last_target = self.last_target if self.last_target is not None else target - self.delay
+        self.last_target = target
+
+        frames = self.frames
+        newest = frames[-1]
+        if target - newest.t > self.timeout:
+            return None
+
+        # Impulses that happened in (last_target, target]
+        out = FeatureFrame()
+        for f in frames:
+            if last_target < f.t <= target:
+                for k in IMPULSE_KEYS:
+                    setattr(out, k, max(getattr(out, k), getattr(f.features, k)))
+
+        if target >= newest.t:
+            # Stream ran dry: hold the newest frame and let it decay
+            fade = math.exp(-(target - newest.t) / self.decay)
+            for k in LEVEL_KEYS:
+                setattr(out, k, getattr(newest.features, k) * fade)
+            return out, newest.hues, newest.saturation
+
+        a = b = frames[0]
+        for f in frames:
+            if f.t <= target:
+                a = f
+            else:
+                b = f
+                break
+        span = b.t - a.t
+        w = 0.0 if span <= 0 else min(1.0, max(0.0, (target - a.t) / span))
+        for k in LEVEL_KEYS:
+            setattr(out, k, getattr(a.features, k) * (1.0 - w) + getattr(b.features, k) * w)
+        return out, a.hues, a.saturation
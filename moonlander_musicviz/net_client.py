@@ -0,0 +1,72 @@
+"""Network client: receive broadcast features → drive local keyboard(s)."""
+import time
+import select
+import argparse
+from .net_broadcast import FeatureReceiver, FrameInterpolator, DEFAULT_ADDRESS
+from .hid_sender import HIDSender, HIDSenderGroup
+
+def main():
+    """Receive → interpolate → send at a fixed rate."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listen", default=DEFAULT_ADDRESS,
+                        help=f"Multicast group or local address to listen on (default: {DEFAULT_ADDRESS})")
+    parser.add_argument("--delay", type=float, default=50.0, help="Playout delay in ms (absorbs jitter/loss)")
+    parser.add_argument("--all-keyboards", action="store_true", help="Drive every connected board")
+    args = parser.parse_args()
+
+    print("[*] Moonlander Music Visualizer (network client)")
+    print("[*] Opening QMK Raw HID...")
+    try:
+        sender = HIDSenderGroup() if args.all_keyboards else HIDSender()
+    except RuntimeError as e:
+        print(f"[-] Error: {e}")
+        return
+
+    receiver = FeatureReceiver(args.listen)
+    interp = FrameInterpolator(delay=args.delay / 1000.0)
+    print(f"[+] Listening on {args.listen}")
+
+    update_interval = 1.0 / 30
+    next_send = time.time()
+    last_report = time.time()
+    streaming = False
+
+    try:
+        while True:
+            # Sleep until the next send slot, waking early for incoming frames
+            timeout = max(0.0, next_send - time.time())
+            ready, _, _ = select.select([receiver], [], [], timeout)
+            if ready:
+                for frame, recv_time in receiver.recv_all():
+                    interp.push(frame, recv_time)
+
+            now = time.time()
+            if now < next_send:
+                continue
+            next_send = max(next_send + update_interval, now - update_interval)
+
+            sample = interp.sample(now)
+            if sample is None:
+                if streaming:
+                    print("[*] Stream lost, waiting...")
+                    streaming = False
+                continue
+            if not streaming:
+                print("[+] Receiving")
+                streaming = True
+
+            features, (h_b, h_m, h_t), saturation = sample
+            sender.send_packet(features, hue_bass=h_b, hue_mid=h_m, hue_treble=h_t, saturation=saturation)
+
+            if now - last_report > 10.0:
+                print(f"[NET] received={interp.received} lost={interp.lost} late={interp.late}")
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sender.close()
+        receiver.close()
+
+if __name__ == "__main__":
+    main()
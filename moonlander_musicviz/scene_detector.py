@@ -0,0 +1,107 @@
+"""Section-boundary (scene change) detection from a rolling window of band energies."""
+import math
+
+SCENE_KEYS = ('bass', 'mid', 'treble', 'loudness_rms')
+
+
+class SceneDetector:
+    """
+    Causal novelty detector over a FeatureHistory.
+
+    Novelty compares the band-energy vector of the last `short` seconds with the
+    `long` seconds before it: the per-band difference of means, scaled by the
+    long window's spread, combined as an RMS over bands. It only reads views of
+    the shared history, so each hop costs O(window) with no allocation growth.
+
+    A boundary is a local maximum of the novelty curve that clears an adaptive
+    threshold (running mean + k·std of the curve) at least `min_scene` seconds
+    after the previous one. The trigger then waits for the next kick (up to
+    `snap` seconds) so transitions land on the beat. After `max_scene` seconds
+    without a boundary a transition is forced the same way.
+
+    update() answers "change the scene now?" (peaks and the timer alike).
+    `boundary` is only set on the hop where a novelty peak is found, and holds
+    the estimated musical boundary time: the split between the two windows at
+    the peak, before any snapping. Consumers that record song structure (the
+    track cache) should use it and ignore forced changes.
+    """
+
+    def __init__(self, history, short=2.0, long=8.0, k=1.5, floor=1.0,
+                 min_scene=8.0, max_scene=45.0, snap=0.6, adapt=20.0):
+        self.history = history
+        self.n_short = history.frames_for(short)
+        self.n_long = history.frames_for(long)
+        if self.n_short + self.n_long > history.capacity:
+            raise ValueError("history is shorter than the novelty window")
+        self.k = k
+        self.floor = floor
+        self.min_scene = min_scene
+        self.max_scene = max_scene
+        self.snap = snap
+        # EMA coefficient for the threshold statistics (time constant `adapt` s)
+        self.alpha = 1.0 / max(1.0, adapt * history.rate)
+
+        self.short = short
+        self.novelty = 0.0
+        self.prev_novelty = 0.0
+        self.prev2_novelty = 0.0
+        self.prev_time = None
+        self.pending_peak = False
+        self.boundary = None
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_scene = None
+        self.pending_since = None
+
+    def _compute_novelty(self):
+        n = self.n_short + self.n_long
+        window = self.history.view(n)
+        total = 0.0
+        for key in SCENE_KEYS:
+            col = window[key]
+            recent = col[self.n_long:]
+            before = col[:self.n_long]
+            d = (recent.mean() - before.mean()) / (before.std() + 0.05)
+            total += d * d
+        return math.sqrt(total / len(SCENE_KEYS))
+
+    def update(self, now, kick=0.0):
+        """Call once per hop after the history was appended. Returns True to change scene."""
+        self.boundary = None
+        if self.last_scene is None:
+            self.last_scene = now
+        if len(self.history) < self.n_short + self.n_long:
+            self.prev_time = now
+            return False
+
+        self.prev2_novelty = self.prev_novelty
+        self.prev_novelty = self.novelty
+        self.novelty = nov = float(self._compute_novelty())
+
+        # Peak of the novelty curve: it was rising and has just turned down
+        threshold = max(self.floor, self.mean + self.k * math.sqrt(self.var))
+        peaked = (self.prev_novelty > threshold and self.prev2_novelty <= self.prev_novelty
+                  and nov < self.prev_novelty)
+        since = now - self.last_scene
+
+        if peaked and since >= self.min_scene and not self.pending_peak:
+            # The curve peaked on the previous hop, when the boundary sat at the window split
+            self.boundary = self.prev_time - self.short
+            self.pending_peak = True
+            if self.pending_since is None:
+                self.pending_since = now
+        elif self.pending_since is None and since >= self.max_scene:
+            self.pending_since = now
+        self.prev_time = now
+
+        # Threshold statistics follow the curve slowly
+        diff = nov - self.mean
+        self.mean += self.alpha * diff
+        self.var = (1.0 - self.alpha) * (self.var + self.alpha * diff * diff)
+
+        if self.pending_since is not None and (kick > 0.5 or now - self.pending_since >= self.snap):
+            self.pending_since = None
+            self.pending_peak = False
+            self.last_scene = now
+            return True
+        return False
@@ -0,0 +1,192 @@
+"""Memory-mapped columnar session recorder: one fixed-size record per analysis hop."""
+import os
+import numpy as np
+from .audio_analyzer import FEATURE_KEYS
+
+FILE_MAGIC = b"MVSESS1\0"
+FILE_VERSION = 2
+HEADER_SIZE = 1024
+GROW_FRAMES = 1 << 17   # ~47 min at 48 kHz / 1024 hop; file grows in steps of this
+
+SCREEN_SYNC_ID = 254
+UNKNOWN_PALETTE_ID = 255
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('count', '<u8'),          # committed records; updated after every append
+    ('capacity', '<u8'),
+    ('sr', '<u4'),
+    ('hop', '<u4'),
+    ('palettes', 'S960'),      # comma-separated names, index = palette id
+])
+
+RECORD_DTYPE = np.dtype(
+    [('t', '<f8')] +
+    [(k, '<f4') for k in FEATURE_KEYS] +
+    [
+        ('sent', 'u1'),        # 1 if a packet went out on this hop
+        ('palette', 'u1'),
+        ('hue_bass', 'u1'), ('hue_mid', 'u1'), ('hue_treble', 'u1'),
+        ('saturation', 'u1'),
+        ('packet', 'u1', (32,)),
+    ]
+)
+
+
+class SessionRecorder:
+    """
+    Appends analysis frames to a preallocated memory-mapped file.
+
+    Per hop: append() stores the timestamp and raw analyzer features, and
+    mark_sent() adds palette, hues, saturation and the encoded packet to the
+    same record when one was sent. Rows are written straight into column views
+    of the mapping, so the steady state creates no per-frame Python objects
+    beyond the scalars being stored. The header count is updated after each
+    record, so a crashed session stays readable.
+    """
+
+    def __init__(self, path, palette_names=(), sr=48000, hop=1024, grow_frames=GROW_FRAMES):
+        self.path = path
+        self.grow_frames = grow_frames
+        self.palette_ids = {name: i for i, name in enumerate(palette_names)}
+        self.palette_ids["Screen Sync"] = SCREEN_SYNC_ID
+        self.count = 0
+        self.capacity = 0
+
+        with open(path, 'wb') as f:
+            f.truncate(HEADER_SIZE)
+        self._header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        self._header['magic'] = FILE_MAGIC
+        self._header['version'] = FILE_VERSION
+        self._header['record_size'] = RECORD_DTYPE.itemsize
+        self._header['sr'] = sr
+        self._header['hop'] = hop
+        self._header['palettes'] = ",".join(palette_names).encode('utf-8')[:960]
+        self._count = self._header['count']
+
+        self._records = None
+        self._grow()
+
+    def _grow(self):
+        """Extend the file by grow_frames records and remap the columns."""
+        if self._records is not None:
+            self._records.flush()
+        self._records = None
+        self.capacity += self.grow_frames
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + self.capacity * RECORD_DTYPE.itemsize)
+        self._header['capacity'] = self.capacity
+
+        self._records = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r+',
+                                  offset=HEADER_SIZE, shape=(self.capacity,))
+        cols = {name: self._records[name] for name in RECORD_DTYPE.names}
+        self._t = cols['t']
+        self._features = [(k, cols[k]) for k in FEATURE_KEYS]
+        self._sent = cols['sent']
+        self._palette = cols['palette']
+        self._hue_bass = cols['hue_bass']
+        self._hue_mid = cols['hue_mid']
+        self._hue_treble = cols['hue_treble']
+        self._saturation = cols['saturation']
+        self._packet = cols['packet']
+
+    def append(self, now, features):
+        """Record the analyzer output for one hop."""
+        i = self.count
+        if i >= self.capacity:
+            self._grow()
+        self._t[i] = now
+        for k, col in self._features:
+            col[i] = getattr(features, k)
+        self.count = i + 1
+        self._count[0] = self.count
+
+    def mark_sent(self, palette_name, hues, saturation, packet):
+        """Attach the visual state and packet sent on the current hop."""
+        i = self.count - 1
+        if i < 0:
+            return
+        self._sent[i] = 1
+        self._palette[i] = self.palette_ids.get(palette_name, UNKNOWN_PALETTE_ID)
+        self._hue_bass[i] = hues[0]
+        self._hue_mid[i] = hues[1]
+        self._hue_treble[i] = hues[2]
+        self._saturation[i] = saturation
+        if packet is not None:
+            self._packet[i] = np.frombuffer(packet, dtype=np.uint8)
+
+    def close(self):
+        """Flush and trim the unused tail of the file."""
+        if self._records is None:
+            return
+        self._records.flush()
+        self._header.flush()
+        self._records = self._header = self._count = None
+        self._t = self._features = self._sent = self._palette = None
+        self._hue_bass = self._hue_mid = self._hue_treble = None
+        self._saturation = self._packet = None
+        size = HEADER_SIZE + self.count * RECORD_DTYPE.itemsize
+        with open(self.path, 'r+b') as f:
+            f.truncate(size)
+            # Keep the header consistent with the trimmed file
+            header = np.memmap(f, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+            header['capacity'] = self.count
+            header.flush()
+            del header
+
+
+class SessionReader:
+    """
+    Maps a recorded session read-only. Nothing is loaded up front: records,
+    column() and between() return numpy views into the mapping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))[0]
+        if bytes(header['magic']) != FILE_MAGIC.rstrip(b"\0"):
+            raise ValueError(f"{path}: not a session recording")
+        if int(header['version']) != FILE_VERSION or int(header['record_size']) != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path}: unsupported session format")
+
+        self.sr = int(header['sr'])
+        self.hop = int(header['hop'])
+        names = bytes(header['palettes']).decode('utf-8')
+        self.palette_names = names.split(",") if names else []
+
+        # Never map past what was committed or what is actually on disk
+        on_disk = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        count = min(int(header['count']), on_disk)
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                     offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        if len(self.records) < 2:
+            return 0.0
+        return float(self.records['t'][-1] - self.records['t'][0])
+
+    def column(self, name):
+        """View of one column (e.g. 'kick', 'packet')."""
+        return self.records[name]
+
+    def between(self, t0, t1):
+        """View of the records with t0 <= t < t1 (absolute timestamps)."""
+        t = self.records['t']
+        i0, i1 = np.searchsorted(t, [t0, t1])
+        return self.records[i0:i1]
+
+    def palette_name(self, palette_id):
+        if palette_id == SCREEN_SYNC_ID:
+            return "Screen Sync"
+        if palette_id < len(self.palette_names):
+            return self.palette_names[palette_id]
+        return "Unknown"
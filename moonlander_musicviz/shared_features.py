@@ -0,0 +1,247 @@
+"""Shared-memory feature ring: audio engine process → UI process (seqlock, no pickling)."""
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from .audio_analyzer import FEATURE_KEYS, FeatureFrame
+
+DEFAULT_NAME = "moonlander_musicviz"
+MAGIC = 0x4D565A31  # 'MVZ1'
+VERSION = 2
+RING_SLOTS = 64
+
+# Header: written by the engine (device, head) and by the UI (screen palette).
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('slots', '<u4'),
+    ('pid', '<u4'),
+    ('head', '<u8'),            # number of frames published so far
+    ('device', 'S64'),
+    ('screen_seq', '<u8'),      # seqlock for the UI → engine screen palette
+    ('screen_t', '<f8'),
+    ('screen_hues', 'u1', (3,)),
+    ('screen_sat', 'u1'),
+], align=True)
+
+# One ring slot. 'seq' is odd while the writer is inside the slot.
+FRAME_DTYPE = np.dtype(
+    [('seq', '<u8'), ('frame', '<u8'), ('t', '<f8')] +
+    [(k, '<f4') for k in FEATURE_KEYS] +
+    [
+        ('hue_bass', 'u1'), ('hue_mid', 'u1'), ('hue_treble', 'u1'),
+        ('saturation', 'u1'),
+        ('palette', 'S32'),
+        ('track', 'S96'),
+    ],
+    align=True,
+)
+
+
+def _owner_pid(shm):
+    """pid stored in a segment's header, or None if it is not one of ours."""
+    if shm.size < HEADER_DTYPE.itemsize:
+        return None
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+    pid = int(header['pid']) if int(header['magic']) == MAGIC else None
+    del header
+    return pid or None
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # exists, but belongs to another user
+    return True
+
+
+class SharedFeatureRing:
+    """
+    Fixed-layout ring of analysis frames in POSIX shared memory.
+
+    The engine publishes one slot per packet and never blocks; readers copy the
+    newest slot and retry if the writer touched it meanwhile (seqlock).
+    The UI may also publish a screen palette back to the engine via the header.
+
+    Use SharedFeatureRing.create() in the engine and .attach() in the UI.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        slots = int(self.header['slots'])
+        self.frames = np.ndarray(
+            (slots,), dtype=FRAME_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize
+        )
+        self.slots = slots
+        # Column views, so the hot path does no per-field lookups by name
+        self._seq = self.frames['seq']
+        self._cols = {name: self.frames[name] for name in FRAME_DTYPE.names}
+
+    @staticmethod
+    def _size(slots):
+        return HEADER_DTYPE.itemsize + slots * FRAME_DTYPE.itemsize
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, device_name="", slots=RING_SLOTS):
+        """
+        Create (or replace a stale) segment and initialize its header.
+        Raises RuntimeError if the segment belongs to an engine that is still running.
+        """
+        size = cls._size(slots)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            pid = _owner_pid(stale)
+            if pid is not None and _pid_alive(pid):
+                # Not ours to unlink: keep the resource tracker away from it too
+                try:
+                    resource_tracker.unregister(stale._name, "shared_memory")
+                except Exception:
+                    pass
+                stale.close()
+                raise RuntimeError(f"Shared memory '{name}' is in use by a running engine (pid {pid}); "
+                                   f"stop it or pick another --shm-name.")
+            # Left behind by an engine that did not exit cleanly
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        shm.buf[:size] = bytes(size)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header['slots'] = slots
+        header['version'] = VERSION
+        header['pid'] = os.getpid()
+        header['device'] = device_name.encode('utf-8')[:64]
+        header['magic'] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """
+        Attach to an existing segment. Raises FileNotFoundError if no engine is running
+        and RuntimeError on a layout mismatch.
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        # Python registers attached segments with the resource tracker and would
+        # unlink them when the UI exits; the engine owns the segment's lifetime.
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        ok = int(header['magic']) == MAGIC and int(header['version']) == VERSION
+        del header
+        if not ok:
+            shm.close()
+            raise RuntimeError(f"Shared memory '{name}' has an unknown layout.")
+        return cls(shm, owner=False)
+
+    # === Engine side ===
+
+    def publish(self, now, features, palette_name, track_name, hues, saturation):
+        """Write one frame into the next slot. Never waits for readers."""
+        head = int(self.header['head'])
+        i = head % self.slots
+        seq = int(self._seq[i])
+        cols = self._cols
+
+        self._seq[i] = seq + 1  # odd: write in progress
+        cols['frame'][i] = head
+        cols['t'][i] = now
+        for k in FEATURE_KEYS:
+            cols[k][i] = getattr(features, k)
+        cols['hue_bass'][i] = hues[0]
+        cols['hue_mid'][i] = hues[1]
+        cols['hue_treble'][i] = hues[2]
+        cols['saturation'][i] = saturation
+        cols['palette'][i] = palette_name.encode('utf-8')[:32]
+        cols['track'][i] = track_name.encode('utf-8')[:96]
+        self._seq[i] = seq + 2  # even: committed
+
+        self.header['head'] = head + 1
+
+    def read_screen_palette(self, max_age=1.0):
+        """Return (h_b, h_m, h_t, sat) published by the UI, or None if stale/absent."""
+        h = self.header
+        for _ in range(4):
+            s1 = int(h['screen_seq'])
+            if s1 == 0 or s1 & 1:
+                continue
+            t = float(h['screen_t'])
+            hues = h['screen_hues'].tolist()
+            sat = int(h['screen_sat'])
+            if int(h['screen_seq']) == s1:
+                if time.time() - t > max_age:
+                    return None
+                return hues[0], hues[1], hues[2], sat
+        return None
+
+    # === UI side ===
+
+    @property
+    def device_name(self):
+        return bytes(self.header['device'][()]).decode('utf-8', 'replace')
+
+    @property
+    def head(self):
+        return int(self.header['head'])
+
+    def read_latest(self):
+        """
+        Return a copy of the newest committed frame as a dict, or None if nothing
+        has been published yet (or the writer kept lapping us).
+        """
+        for _ in range(8):
+            head = int(self.header['head'])
+            if head == 0:
+                return None
+            i = (head - 1) % self.slots
+            s1 = int(self._seq[i])
+            if s1 & 1:
+                continue
+            row = self.frames[i].copy()
+            if int(self._seq[i]) != s1 or int(row['frame']) != head - 1:
+                continue
+            features = FeatureFrame()
+            for k in FEATURE_KEYS:
+                setattr(features, k, float(row[k]))
+            return {
+                'frame': int(row['frame']),
+                't': float(row['t']),
+                'features': features,
+                'hues': (int(row['hue_bass']), int(row['hue_mid']), int(row['hue_treble'])),
+                'saturation': int(row['saturation']),
+                'palette': bytes(row['palette']).decode('utf-8', 'replace'),
+                'track': bytes(row['track']).decode('utf-8', 'replace'),
+            }
+        return None
+
+    def write_screen_palette(self, h_b, h_m, h_t, saturation):
+        """Publish a screen-derived palette for the engine to pick up."""
+        h = self.header
+        seq = int(h['screen_seq'])
+        h['screen_seq'] = seq + 1
+        h['screen_t'] = time.time()
+        h['screen_hues'] = (h_b, h_m, h_t)
+        h['screen_sat'] = saturation
+        h['screen_seq'] = seq + 2
+
+    def close(self):
+        """Detach; the owning engine also unlinks the segment."""
+        if self.shm is None:
+            return
+        # Drop numpy views before closing the mmap
+        self.header = self.frames = self._seq = self._cols = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.shm = None
@@ -0,0 +1,294 @@
+"""Per-track analysis cache: beat grid, sections and loudness envelope, keyed by "Artist - Track"."""
+import os
+import hashlib
+import numpy as np
+
+ENVELOPE_HZ = 10          # loudness envelope resolution
+MIN_COVERAGE = 0.8        # fraction of a track that must be heard before it is cached
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "moonlander_musicviz", "tracks")
+
+
+class TrackProfile:
+    """
+    Analysis result for one track. All times are seconds from the track start.
+
+    - beats: onset times of the kick (the beat grid)
+    - sections: section boundary times
+    - loudness: loudness envelope at ENVELOPE_HZ (0–1)
+    """
+
+    def __init__(self, duration, beats, sections, loudness):
+        self.duration = float(duration)
+        self.beats = np.asarray(beats, dtype=np.float32)
+        self.sections = np.asarray(sections, dtype=np.float32)
+        self.loudness = np.asarray(loudness, dtype=np.float32)
+
+    def save(self, path):
+        # Written to a temp file first so a reader never sees half a profile
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, duration=np.float32(self.duration), beats=self.beats,
+                     sections=self.sections,
+                     loudness=np.round(self.loudness * 255).astype(np.uint8))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(float(z['duration']), z['beats'], z['sections'],
+                       z['loudness'].astype(np.float32) / 255.0)
+
+    def next_after(self, times, position):
+        """Return the first time in `times` strictly after `position`, or None."""
+        i = int(np.searchsorted(times, position, side='right'))
+        return float(times[i]) if i < len(times) else None
+
+
+def find_sections(loudness, rate=ENVELOPE_HZ, span=4.0, min_gap=8.0, threshold=0.15):
+    """
+    Section boundaries from a loudness envelope: points where the mean level of the
+    next `span` seconds differs from the previous `span` seconds by more than
+    `threshold`, keeping only local maxima at least `min_gap` apart.
+    """
+    n = int(span * rate)
+    if len(loudness) < 2 * n + 1:
+        return np.zeros(0, dtype=np.float32)
+
+    csum = np.concatenate([[0.0], np.cumsum(loudness, dtype=np.float64)])
+    centers = np.arange(n, len(loudness) - n)
+    before = (csum[centers] - csum[centers - n]) / n
+    after = (csum[centers + n] - csum[centers]) / n
+    novelty = np.abs(after - before)
+
+    boundaries = []
+    gap = int(min_gap * rate)
+    for j in np.argsort(novelty)[::-1]:
+        if novelty[j] < threshold:
+            break
+        c = centers[j]
+        if all(abs(c - b) >= gap for b in boundaries):
+            boundaries.append(c)
+    return np.sort(np.array(boundaries, dtype=np.float32)) / rate
+
+
+class TrackProfiler:
+    """Builds a TrackProfile from live features while a track plays."""
+
+    def __init__(self, duration):
+        self.duration = duration
+        n = int(duration * ENVELOPE_HZ) + 1
+        self.loud_sum = np.zeros(n, dtype=np.float32)
+        self.loud_cnt = np.zeros(n, dtype=np.uint16)
+        self.beats = []
+        self.sections = []
+
+    def observe(self, position, features, section=None):
+        """One analysis hop at track `position`; `section` is a detected boundary position."""
+        i = int(position * ENVELOPE_HZ)
+        if 0 <= i < len(self.loud_sum):
+            self.loud_sum[i] += features.loudness_rms
+            self.loud_cnt[i] = min(self.loud_cnt[i] + 1, 65535)
+        if features.kick > 0.5 and 0.0 <= position <= self.duration:
+            self.beats.append(position)
+        if section is not None and 0.0 <= section <= self.duration:
+            self.sections.append(section)
+
+    def coverage(self):
+        return float(np.count_nonzero(self.loud_cnt)) / max(1, len(self.loud_cnt))
+
+    def finish(self):
+        """Return the TrackProfile, or None if too little of the track was heard."""
+        if self.coverage() < MIN_COVERAGE:
+            return None
+        heard = self.loud_cnt > 0
+        loudness = np.zeros_like(self.loud_sum)
+        loudness[heard] = self.loud_sum[heard] / self.loud_cnt[heard]
+        # Fill gaps (seeks, dropped hops) from the previous heard bin
+        idx = np.where(heard, np.arange(len(loudness)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        loudness = loudness[idx]
+        # Prefer the live scene detector's boundaries; fall back to loudness steps
+        sections = sorted(self.sections) if self.sections else find_sections(loudness)
+        return TrackProfile(self.duration, sorted(self.beats), sections, loudness)
+
+
+class TrackCache:
+    """
+    On-disk LRU cache of TrackProfiles. Entries are touched on every hit and the
+    least recently used ones are removed once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, track_name):
+        key = hashlib.sha1(track_name.encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.root, key + ".npz")
+
+    def get(self, track_name):
+        path = self._path(track_name)
+        try:
+            profile = TrackProfile.load(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(path)  # LRU: mark as recently used
+        return profile
+
+    def put(self, track_name, profile):
+        profile.save(self._path(track_name))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".npz"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class TrackAligner:
+    """
+    Maps wall-clock time to a position inside a cached track.
+
+    Coarse position comes from TrackInfo polls; live kick onsets pull the
+    estimate onto the cached beat grid so predictions stay within a few ms.
+    """
+
+    def __init__(self, profile, position, now):
+        self.profile = profile
+        self.offset = 0.0
+        self.anchor_pos = position
+        self.anchor_t = now
+
+    def sync(self, position, now):
+        """
+        Re-anchor from a player position report. Small differences are poll
+        jitter and are left to observe_kick(); only seeks move the anchor.
+        """
+        if abs(self.position(now) - position) > 1.0:
+            self.offset = 0.0
+            self.anchor_pos = position
+            self.anchor_t = now
+
+    def position(self, now):
+        return self.anchor_pos + (now - self.anchor_t) + self.offset
+
+    def observe_kick(self, now, window=0.08, gain=0.2):
+        """Nudge the offset towards the nearest cached beat."""
+        beats = self.profile.beats
+        if len(beats) == 0:
+            return
+        pos = self.position(now)
+        i = int(np.searchsorted(beats, pos))
+        nearest = min((beats[j] for j in (i - 1, i) if 0 <= j < len(beats)),
+                      key=lambda b: abs(b - pos))
+        err = float(nearest) - pos
+        if abs(err) < window:
+            self.offset += gain * err
+
+    def time_to_beat(self, now):
+        pos = self.position(now)
+        nxt = self.profile.next_after(self.profile.beats, pos)
+        return None if nxt is None else nxt - pos
+
+    def time_to_section(self, now):
+        pos = self.position(now)
+        nxt = self.profile.next_after(self.profile.sections, pos)
+        return None if nxt is None else nxt - pos
+
+
+# Backwards position jump (s) between two polls that counts as a restart
+RESTART_JUMP = 5.0
+
+
+class TrackSync:
+    """
+    Glue for main(): learns profiles for new tracks and aligns to cached ones.
+
+    Feed it every TrackInfo poll (on_track_state) and every analysis hop (on_hop).
+    time_to_beat / time_to_section return None unless a cached track is aligned.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.track = None
+        self.profiler = None
+        self.aligner = None
+        self.playing = False
+        self.anchor_pos = 0.0
+        self.anchor_t = 0.0
+
+    def on_track_state(self, track_name, position, duration, now):
+        self.playing = position is not None and bool(duration)
+        if not self.playing:
+            # Paused / closed: keep state for the same track, stop predicting
+            return
+
+        # Same track from the start again (repeat-one, replay) or a seek back:
+        # store what was learned and look it up again like a new track
+        restarted = track_name == self.track and position < self.anchor_pos - RESTART_JUMP
+        if track_name != self.track or restarted:
+            self._finish()
+            self.track = track_name
+            profile = self.cache.get(track_name)
+            if profile is not None:
+                self.aligner = TrackAligner(profile, position, now)
+            else:
+                self.profiler = TrackProfiler(duration)
+        elif self.aligner is not None:
+            self.aligner.sync(position, now)
+
+        self.anchor_pos = position
+        self.anchor_t = now
+
+    def on_hop(self, now, features, boundary=None):
+        """One analysis hop; `boundary` is SceneDetector.boundary (engine time) or None."""
+        if not self.playing:
+            return
+        if self.aligner is not None:
+            if features.kick > 0.5:
+                self.aligner.observe_kick(now)
+        elif self.profiler is not None:
+            section = None if boundary is None else self.anchor_pos + (boundary - self.anchor_t)
+            self.profiler.observe(self.anchor_pos + (now - self.anchor_t), features, section)
+
+    def time_to_beat(self, now):
+        if not self.playing or self.aligner is None:
+            return None
+        return self.aligner.time_to_beat(now)
+
+    def time_to_section(self, now):
+        if not self.playing or self.aligner is None:
+            return None
+        return self.aligner.time_to_section(now)
+
+    def _finish(self):
+        if self.profiler is not None and self.track:
+            profile = self.profiler.finish()
+            if profile is not None:
+                try:
+                    self.cache.put(self.track, profile)
+                except OSError as e:
+                    print(f"[Cache] Failed to store profile: {e}")
+        self.profiler = None
+        self.aligner = None
+
+    def close(self):
+        self._finish()
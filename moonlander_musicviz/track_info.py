@@ -9,11 +9,21 @@ class TrackInfo:
         """
         Returns a string like "Artist - Track" or "No Music" if failed/paused.
         """
+        return self.get_state()[0]
+    
+    def get_state(self):
+        """
+        Returns (label, position, duration).
+
+        label is "Artist - Track" while playing, otherwise a status string.
+        position/duration are seconds, or None when nothing is playing.
+        """
         script = '''
         if application "Music" is running then
             tell application "Music"
                 if player state is playing then
-                    return (get artist of current track) & " - " & (get name of current track)
+                    set t to (get artist of current track) & " - " & (get name of current track)
+                    return t & tab & (player position as text) & tab & ((duration of current track) as text)
                 else
                     return "Paused"
                 end if
@@ -35,9 +45,20 @@ class TrackInfo:
             if result.returncode == 0:
                 output = result.stdout.strip()
                 # Handle cases where output might be empty
-                return output if output else "Unknown Track"
+                if not output:
+                    return "Unknown Track", None, None
+                parts = output.split("\t")
+                if len(parts) != 3:
+                    return output, None, None
+                try:
+                    # AppleScript formats reals with the user's locale (e.g. "12,5")
+                    position = float(parts[1].replace(",", "."))
+                    duration = float(parts[2].replace(",", "."))
+                except ValueError:
+                    position = duration = None
+                return parts[0], position, duration
             else:
-                return "No Info"
+                return "No Info", None, None
                 
         except Exception:
-            return "Info Error"
+            return "Info Error", None, None
@@ -0,0 +1,75 @@
+"""Dashboard process: attach to a running engine's shared memory and render it."""
+import time
+import argparse
+from .shared_features import SharedFeatureRing, DEFAULT_NAME
+from .feature_history import FeatureHistory
+
+def attach_ring(name, retry_interval=0.5):
+    """Block until the engine has created the shared segment."""
+    announced = False
+    while True:
+        try:
+            return SharedFeatureRing.attach(name)
+        except FileNotFoundError:
+            if not announced:
+                print(f"[*] Waiting for engine (shared memory '{name}')...")
+                announced = True
+            time.sleep(retry_interval)
+
+def main():
+    """Render loop: read newest frame → update dashboard. Detach any time with Ctrl+C."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", default=DEFAULT_NAME, help="Shared memory name used by the engine")
+    parser.add_argument("--screen", action="store_true",
+                        help="Run screen color sync here and feed it to the engine (engine needs --screen)")
+    args = parser.parse_args()
+
+    from .dashboard import TerminalDashboard
+    from rich.live import Live
+
+    ring = attach_ring(args.name)
+    device_name = ring.device_name
+
+    screen_analyzer = None
+    if args.screen:
+        from .screen_analyzer import ScreenAnalyzer
+        screen_analyzer = ScreenAnalyzer()
+
+    dashboard = TerminalDashboard()
+    refresh_hz = 30
+    history = FeatureHistory(seconds=30.0, rate=refresh_hz)
+    interval = 1.0 / refresh_hz
+    last_head = -1
+    last_progress = time.time()
+
+    try:
+        with Live(dashboard.layout, refresh_per_second=refresh_hz, screen=True) as live:
+            while True:
+                started = time.time()
+
+                if screen_analyzer is not None:
+                    ring.write_screen_palette(*screen_analyzer.get_palette())
+
+                frame = ring.read_latest()
+                if frame is not None:
+                    if ring.head != last_head:
+                        last_head = ring.head
+                        last_progress = started
+                        history.append(frame['t'], frame['features'])
+                    track = frame['track']
+                    if started - last_progress > 2.0:
+                        track = "Engine stalled / stopped"
+                    live.update(dashboard.update(
+                        frame['features'], frame['palette'], device_name, track,
+                        hues=frame['hues'], saturation=frame['saturation'], history=history
+                    ))
+
+                time.sleep(max(0.0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ typedef struct {
   uint8_t master_gain;
   uint8_t loudness_rms, loudness_peak;
   uint8_t bass, mid, treble;
+  // Per-half levels (left = columns left of center); copies of bass/mid/treble without stereo data
+  uint8_t bass_l, mid_l, treble_l;
+  uint8_t bass_r, mid_r, treble_r;
   uint8_t beat;
   uint8_t hue_bass, hue_mid, hue_treble;
   uint8_t saturation;
@@ -17,5 +20,9 @@ typedef struct {
   uint8_t beat_refractory_ms;
   uint32_t last_rx_ms;
   uint32_t last_beat_ms;
-  uint8_t strobe_enable, safety_limit;
+  uint8_t strobe_enable, safety_limit, stereo;
 } musicviz_state_t;
+
+// Echo the latest packet (seq, host time, rx/apply time) back to the host.
+// Call once per rendered frame; does nothing unless a packet asked for an echo.
+void musicviz_send_echo(void);